@@ -0,0 +1,207 @@
+"""
+Portfolio batch underwriting.
+
+Streams a CSV or Parquet book through the compiled workflow on a bounded worker
+pool and writes each result as soon as it completes, so memory stays flat no
+matter how large the input is.
+
+    python batch.py renewals.parquet results.parquet --workers 16
+    python batch.py renewals.csv results.jsonl --executor process
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from typing import Dict, Iterable, Iterator, Optional
+from scoring import PERILS
+
+logger = logging.getLogger(__name__)
+
+def read_rows(path: str, batch_size: int = 1000) -> Iterator[Dict]:
+    """Yield input rows one at a time from a CSV or Parquet file"""
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+        for record_batch in pq.ParquetFile(path).iter_batches(batch_size=batch_size):
+            yield from record_batch.to_pylist()
+    else:
+        with open(path, newline="") as f:
+            yield from csv.DictReader(f)
+
+def to_inputs(row: Dict) -> Dict:
+    """Map an input row onto the workflow's inputs dict"""
+    return {
+        "property_id": str(row.get("property_id", "")),
+        "property_type": row.get("property_type") or "Residential",
+        "address": row["address"],
+        "construction_type": row.get("construction_type") or "unknown",
+        "year_built": int(row["year_built"]),
+        "floors": int(row.get("floors") or 1),
+    }
+
+def underwrite_row(index: int, row: Dict) -> Dict:
+    """Run one row through the workflow and flatten the state into a result record"""
+    from main import get_runtime
+
+    record = {"row": index, "property_id": str(row.get("property_id", "")), "address": row.get("address")}
+    try:
+        state = get_runtime().invoke(to_inputs(row))
+        record.update(
+            # The score is only bounded when lazy evaluation skipped perils
+            natcat_score=state["natcat_score"] if not state.get("skipped_perils") else None,
+            natcat_low=state["natcat_bounds"][0],
+            natcat_high=state["natcat_bounds"][1],
+            decision=state["decision"]["status"],
+            reason=state["decision"]["reason"],
+            error=None,
+            results=state.get("risk_results", {})  # peril -> PerilResult
+        )
+    except Exception as e:
+        logger.error(f"Underwriting failed for row {index}: {e}")
+        record.update(natcat_score=None, natcat_low=None, natcat_high=None, decision=None, reason=None,
+                      error=str(e), results={})
+    return record
+
+def _warm_worker():
+    """Process-pool initializer: compile the workflow once per worker"""
+    from main import get_runtime
+    get_runtime().app
+
+def iter_underwritten(rows: Iterable[Dict], workers: int = 8, executor: str = "thread",
+                     max_in_flight: Optional[int] = None) -> Iterator[Dict]:
+    """
+    Underwrite rows on a bounded pool, yielding result records as they complete.
+
+    Use "thread" workers when provider I/O dominates and "process" workers when
+    scoring is CPU bound. At most max_in_flight rows are held at once.
+    """
+    max_in_flight = max_in_flight or workers * 2
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="underwrite")
+
+    with pool:
+        pending = set()
+        for index, row in enumerate(rows):
+            if len(pending) >= max_in_flight:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(pool.submit(underwrite_row, index, row))
+        for future in pending:
+            yield future.result()
+
+class JsonlWriter:
+    """Append one JSON object per line, with each peril's score, confidence, fallback, raw_ref and factors"""
+
+    def __init__(self, path: str):
+        self._file = open(path, "w")
+
+    def write(self, record: Dict):
+        line = {key: value for key, value in record.items() if key != "results"}
+        results = record["results"]
+        for peril in PERILS:
+            result = results.get(peril)
+            line[peril] = result.score if result else None
+            line[f"{peril}_confidence"] = result.confidence if result else None
+            line[f"{peril}_fallback"] = result.fallback if result else None
+            line[f"{peril}_raw_ref"] = result.raw_ref if result else None
+        line["factors"] = {peril: result.factors for peril, result in results.items()}
+        self._file.write(json.dumps(line) + "\n")
+
+    def close(self):
+        self._file.close()
+
+class ParquetWriter:
+    """
+    Buffer records into row groups and append each group to a Parquet file.
+    Peril results are buffered as typed columns in a ResultBatch.
+    """
+    RECORD_FIELDS = ("row", "property_id", "address", "natcat_score", "natcat_low", "natcat_high",
+                     "decision", "reason", "error")
+
+    def __init__(self, path: str, row_group_size: int = 1000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        from results import ResultBatch
+
+        self._pa = pa
+        self._schema = pa.schema(
+            [("row", pa.int64()), ("property_id", pa.string()), ("address", pa.string()),
+             ("natcat_score", pa.float64()), ("natcat_low", pa.float64()), ("natcat_high", pa.float64()),
+             ("decision", pa.string()), ("reason", pa.string())]
+            + [(peril, pa.float64()) for peril in PERILS]
+            + [(f"{peril}_confidence", pa.float32()) for peril in PERILS]
+            + [(f"{peril}_fallback", pa.string()) for peril in PERILS]
+            + [(f"{peril}_raw_ref", pa.string()) for peril in PERILS]
+            + [("error", pa.string())]
+        )
+        self._writer = pq.ParquetWriter(path, self._schema)
+        self._row_group_size = row_group_size
+        self._buffer = []
+        self._results = ResultBatch(PERILS, capacity=row_group_size)
+
+    def write(self, record: Dict):
+        self._buffer.append(tuple(record[field] for field in self.RECORD_FIELDS))
+        self._results.append(record["results"])
+        if len(self._buffer) >= self._row_group_size:
+            self._flush()
+
+    def close(self):
+        self._flush()
+        self._writer.close()
+
+    def _flush(self):
+        if self._buffer:
+            pa = self._pa
+            columns = {field: list(values) for field, values in zip(self.RECORD_FIELDS, zip(*self._buffer))}
+            for name, values in self._results.columns(factors=False).items():
+                if name in self._schema.names:
+                    # NaN marks a peril with no result; write it as null
+                    columns[name] = pa.array(values, type=self._schema.field(name).type, from_pandas=True)
+            self._writer.write_table(pa.Table.from_pydict(columns, schema=self._schema))
+            self._buffer = []
+            self._results.clear()
+
+def open_writer(path: str):
+    return ParquetWriter(path) if path.endswith(".parquet") else JsonlWriter(path)
+
+def run_batch(input_path: str, output_path: str, workers: int = 8, executor: str = "thread",
+              batch_size: int = 1000) -> Dict:
+    """Underwrite a whole book from input_path into output_path and return run statistics"""
+    stats = {"rows": 0, "errors": 0, "STP": 0, "Referred": 0}
+    started = time.perf_counter()
+    writer = open_writer(output_path)
+    try:
+        for record in iter_underwritten(read_rows(input_path, batch_size), workers, executor):
+            writer.write(record)
+            stats["rows"] += 1
+            if record["error"]:
+                stats["errors"] += 1
+            else:
+                stats[record["decision"]] += 1
+            if stats["rows"] % batch_size == 0:
+                logger.info(f"Underwrote {stats['rows']} rows")
+    finally:
+        writer.close()
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description="Underwrite a portfolio of properties in batch")
+    parser.add_argument("input", help="CSV or Parquet file of properties")
+    parser.add_argument("output", help="Results file (.parquet or .jsonl)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    parser.add_argument("--executor", choices=["thread", "process"], default="thread")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = run_batch(args.input, args.output, args.workers, args.executor, args.batch_size)
+    logger.info(f"Batch complete: {stats}")
+
+if __name__ == "__main__":
+    main()
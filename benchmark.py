@@ -0,0 +1,335 @@
+"""
+End-to-end and per-node benchmarks for the underwriting workflow.
+
+Runs the compiled StateGraph and the real api.RiskAPIs client against stub
+provider endpoints (an httpx MockTransport) with injected latency and error
+rates, so results reflect our code rather than the upstream APIs:
+single-submission latency, throughput at several concurrency levels, time per
+node and peak traced memory. Results are written as JSON and can be compared
+against a stored baseline; the run fails when a metric regresses past the
+tolerance.
+
+    python benchmark.py --output bench.json
+    python benchmark.py --latency-ms 40 --latency fema=120 --error-rate 0.02 --baseline bench.json
+"""
+import argparse
+import functools
+import json
+import logging
+import platform
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, NamedTuple, Optional
+from urllib.parse import urlsplit
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SUBMISSION = {
+    "property_type": "Residential",
+    "address": "123 Main St, Los Angeles, CA",
+    "construction_type": "Wood",
+    "year_built": 1985,
+    "floors": 2,
+}
+
+def latency_stats(seconds: List[float]) -> Dict:
+    ms = np.asarray(seconds) * 1000
+    if not len(ms):
+        return {"count": 0}
+    return {
+        "count": int(len(ms)),
+        "mean_ms": round(float(ms.mean()), 3),
+        "p50_ms": round(float(np.percentile(ms, 50)), 3),
+        "p95_ms": round(float(np.percentile(ms, 95)), 3),
+        "p99_ms": round(float(np.percentile(ms, 99)), 3),
+    }
+
+# ------------------------------
+# Stub providers
+# ------------------------------
+
+# Canned response of each provider, served by StubProviders
+STUB_PAYLOADS = {
+    "hazardhub": {"wildfire": {"score": 64}, "wind": {"hurricaneScore": 50, "tornadoScore": 60, "hailScore": 30}},
+    "fema": {"FLD_ZONE": "AE"},
+    "usgs": {"pga": 0.3},
+    "attom": {"property": {"building": {"condition": "Fair", "yearBuilt": 1985}}},
+    "overpass": {"elements": [{"id": 1, "lat": 34.0689, "lon": -118.2520, "tags": {"name": "Station 3"}}]},
+}
+PROVIDERS = tuple(STUB_PAYLOADS)
+
+class StubProviders:
+    """
+    httpx transport answering every provider host with a canned payload after
+    injected latency, or with a 503 at error_rate. The real api.RiskAPIs client
+    (pooling, breakers, hedging, fallbacks) runs on top of it.
+    """
+
+    def __init__(self, latency_ms: Dict[str, float], jitter: float = 0.2, error_rate: float = 0.0, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.calls = {provider: 0 for provider in PROVIDERS}
+        self.errors = {provider: 0 for provider in PROVIDERS}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._hosts: Dict[str, str] = {}
+
+    def client(self, **options):
+        """api.RiskAPIs served by this transport; claims come from a small in-memory ClaimsIndex"""
+        import httpx
+        import pandas as pd
+        from api import RiskAPIs
+        from claims_index import ClaimsIndex
+
+        claims = ClaimsIndex(pd.DataFrame({
+            "claim_id": [1, 2], "latitude": [34.06, 34.04], "longitude": [-118.25, -118.23],
+            "claim_date": [pd.Timestamp.today().normalize()] * 2,
+        }))
+        risk_client = RiskAPIs({}, transport=httpx.MockTransport(self._handle), claims_index=claims, **options)
+        self._hosts = {urlsplit(config["url"]).netloc: provider
+                       for provider, config in risk_client._client.api_config.items()}
+        return risk_client
+
+    async def _handle(self, request):
+        import asyncio
+        import httpx
+
+        provider = self._hosts[request.url.host]
+        with self._lock:
+            self.calls[provider] += 1
+            delay = self.latency_ms.get(provider, 0) / 1000 * (1 + self._rng.uniform(-self.jitter, self.jitter))
+            failed = self._rng.random() < self.error_rate
+            if failed:
+                self.errors[provider] += 1
+        await asyncio.sleep(max(delay, 0))
+        if failed:
+            return httpx.Response(503, json={"error": "injected failure"})
+        return httpx.Response(200, json=STUB_PAYLOADS[provider])
+
+class _Doc(NamedTuple):
+    page_content: str
+
+class StubRetriever:
+    """Guideline retriever answering every query with a fixed passage after latency_ms"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+
+    def invoke(self, query: str) -> list:
+        time.sleep(self.latency_ms / 1000)
+        return [_Doc(f"Guideline passage for: {query}")]
+
+class StubGeocoder:
+    """Resolves every address to downtown Los Angeles after latency_ms"""
+
+    def __init__(self, latency_ms: float = 0.0):
+        self.latency_ms = latency_ms
+
+    def geocode(self, address: str):
+        from geocoder import GeocodeResult
+        time.sleep(self.latency_ms / 1000)
+        return GeocodeResult(34.0522, -118.2437, address.lower(), "exact")
+
+# ------------------------------
+# Measurements
+# ------------------------------
+
+class NodeTimer:
+    """main.build_workflow node_hook recording wall time per node"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, name: str, node: Callable) -> Callable:
+        @functools.wraps(node)
+        def timed(state):
+            started = time.perf_counter()
+            try:
+                return node(state)
+            finally:
+                elapsed = time.perf_counter() - started
+                with self._lock:
+                    self.samples.setdefault(name, []).append(elapsed)
+        return timed
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+
+    def report(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {name: latency_stats(samples) for name, samples in self.samples.items()}
+
+def _timed_invoke(runtime, i: int):
+    started = time.perf_counter()
+    runtime.invoke({**SUBMISSION, "property_id": f"BENCH-{i}"})
+    return time.perf_counter() - started
+
+def bench_single(runtime, submissions: int) -> Dict:
+    """Latency of one submission at a time"""
+    return latency_stats([_timed_invoke(runtime, i) for i in range(submissions)])
+
+def bench_throughput(runtime, concurrency: int, submissions: int) -> Dict:
+    """Submissions per second and latency with `concurrency` submissions in flight"""
+    latencies, failures = [], 0
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(_timed_invoke, runtime, i) for i in range(submissions)]:
+            try:
+                latencies.append(future.result())
+            except Exception as e:
+                failures += 1
+                logger.error(f"Submission failed: {e}")
+    wall = time.perf_counter() - started
+    return {"concurrency": concurrency, "per_s": round(submissions / wall, 2), "failures": failures,
+            **latency_stats(latencies)}
+
+def bench_memory(runtime, concurrency: int, submissions: int) -> Dict:
+    """Peak memory allocated by Python while a burst of submissions runs (tracemalloc)"""
+    tracemalloc.start()
+    try:
+        bench_throughput(runtime, concurrency, submissions)
+        current, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"submissions": submissions, "concurrency": concurrency,
+            "peak_mb": round(peak / 2 ** 20, 3), "retained_mb": round(current / 2 ** 20, 3)}
+
+def run(latency_ms: Dict[str, float], jitter: float = 0.2, error_rate: float = 0.0,
+        retriever_latency_ms: float = 0.0, geocoder_latency_ms: float = 0.0,
+        single: int = 20, submissions: int = 200, concurrency: Optional[List[int]] = None,
+        memory_submissions: int = 50, evaluation: str = "full") -> Dict:
+    from main import InsurIQ
+
+    concurrency = concurrency or [1, 4, 16]
+    providers = StubProviders(latency_ms, jitter, error_rate)
+    risk_client = providers.client()
+    timer = NodeTimer()
+    runtime = InsurIQ(risk_client=risk_client, retriever=StubRetriever(retriever_latency_ms),
+                      geocoder=StubGeocoder(geocoder_latency_ms), node_hook=timer,
+                      evaluation=evaluation, memoize=False)  # every submission is identical
+    runtime.invoke({**SUBMISSION, "property_id": "WARMUP"})  # compile the graph outside the timings
+    timer.reset()
+
+    results = {"single": bench_single(runtime, single)}
+    results["nodes"] = timer.report()
+    results["throughput"] = {str(c): bench_throughput(runtime, c, submissions) for c in concurrency}
+    results["memory"] = bench_memory(runtime, max(concurrency), memory_submissions)
+    results["providers"] = {"calls": providers.calls, "errors": providers.errors}
+    risk_client.close()
+    results["meta"] = {
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "latency_ms": latency_ms, "jitter": jitter, "error_rate": error_rate,
+        "retriever_latency_ms": retriever_latency_ms, "geocoder_latency_ms": geocoder_latency_ms,
+        "evaluation": evaluation,
+    }
+    return results
+
+# ------------------------------
+# Baseline comparison
+# ------------------------------
+
+def _tracked(results: Dict) -> Dict[str, tuple]:
+    """Metrics compared against the baseline as name -> (value, higher_is_better)"""
+    tracked = {
+        "single.p50_ms": (results["single"].get("p50_ms"), False),
+        "single.p99_ms": (results["single"].get("p99_ms"), False),
+        "memory.peak_mb": (results["memory"]["peak_mb"], False),
+    }
+    for level, row in results["throughput"].items():
+        tracked[f"throughput.{level}.per_s"] = (row["per_s"], True)
+        tracked[f"throughput.{level}.p99_ms"] = (row.get("p99_ms"), False)
+    for node, row in results["nodes"].items():
+        tracked[f"nodes.{node}.p50_ms"] = (row.get("p50_ms"), False)
+    return tracked
+
+def compare(results: Dict, baseline: Dict, tolerance: float = 0.10,
+            min_delta_ms: float = 0.5) -> List[str]:
+    """
+    Regressions beyond tolerance (relative) against baseline. Latency changes
+    smaller than min_delta_ms are ignored, so sub-millisecond nodes do not flap.
+    """
+    regressions = []
+    previous = _tracked(baseline)
+    for name, (value, higher_is_better) in _tracked(results).items():
+        if name not in previous or value is None or previous[name][0] in (None, 0):
+            continue
+        before = previous[name][0]
+        change = (value - before) / before
+        if name.endswith("_ms") and abs(value - before) < min_delta_ms:
+            continue
+        if (change < -tolerance) if higher_is_better else (change > tolerance):
+            regressions.append(f"{name}: {before} -> {value} ({change:+.1%})")
+    return regressions
+
+def _latency_option(values: List[str]) -> Dict[str, float]:
+    """Parse ["fema=120", "hazardhub=300"] into per-provider milliseconds"""
+    overrides = {}
+    for value in values:
+        provider, _, ms = value.partition("=")
+        if provider not in PROVIDERS:
+            raise argparse.ArgumentTypeError(f"unknown provider {provider!r}; expected one of {', '.join(PROVIDERS)}")
+        overrides[provider] = float(ms)
+    return overrides
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the underwriting workflow against stub providers")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="injected latency for every provider")
+    parser.add_argument("--latency", nargs="*", default=[], metavar="PROVIDER=MS", help="per-provider overrides")
+    parser.add_argument("--jitter", type=float, default=0.2, help="latency varies by +/- this fraction")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability a provider call fails")
+    parser.add_argument("--retriever-latency-ms", type=float, default=5.0)
+    parser.add_argument("--geocoder-latency-ms", type=float, default=0.0)
+    parser.add_argument("--single", type=int, default=20, help="sequential submissions for latency")
+    parser.add_argument("--submissions", type=int, default=200, help="submissions per throughput level")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--memory-submissions", type=int, default=50)
+    parser.add_argument("--evaluation", choices=["full", "lazy"], default="full",
+                        help="parallel peril branches, or lazy evaluation with early exit")
+    parser.add_argument("--output", help="write results JSON here")
+    parser.add_argument("--baseline", help="results JSON from an earlier run to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative regression")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    # Injected provider errors are expected; api logs them before falling back
+    logging.getLogger("main").setLevel(logging.ERROR)
+    logging.getLogger("api").setLevel(logging.CRITICAL)
+    latency_ms = {provider: args.latency_ms for provider in PROVIDERS}
+    latency_ms.update(_latency_option(args.latency))
+
+    results = run(latency_ms, args.jitter, args.error_rate, args.retriever_latency_ms, args.geocoder_latency_ms,
+                  args.single, args.submissions, args.concurrency, args.memory_submissions, args.evaluation)
+
+    single = results["single"]
+    print(f"single      p50 {single['p50_ms']:8.2f} ms   p99 {single['p99_ms']:8.2f} ms")
+    for level, row in results["throughput"].items():
+        print(f"c={level:<8} {row['per_s']:8.1f} /s   p50 {row['p50_ms']:8.2f} ms   "
+              f"p99 {row['p99_ms']:8.2f} ms   failures {row['failures']}")
+    for node, row in sorted(results["nodes"].items(), key=lambda item: -item[1]["p50_ms"]):
+        print(f"  {node:<30} p50 {row['p50_ms']:8.3f} ms   p99 {row['p99_ms']:8.3f} ms")
+    print(f"peak memory {results['memory']['peak_mb']:.1f} MB")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Local spatial index over a snapshot of claims_history.
+
+Replaces the per-property ST_DISTANCE scan in the warehouse with an in-memory
+grid keyed by location, filtered by claim_date. The snapshot is persisted to
+Parquet, and refresh() pulls only claims at or after the current claim_date
+watermark, so keeping it current costs one small delta query. The runtime
+refreshes its index every Config.CLAIMS_REFRESH_INTERVAL seconds with
+refresh_every(); the Parquet file is only the starting point, so rebuild it
+(ClaimsIndex.save) when restarts should begin from a newer snapshot.
+"""
+import logging
+import threading
+from datetime import date
+from typing import Callable, Optional
+import numpy as np
+import pandas as pd
+from fire_stations import haversine_km
+
+logger = logging.getLogger(__name__)
+
+KM_PER_DEGREE = 111.32
+
+class _Snapshot:
+    """Immutable view of the claims and their grid; swapped atomically on refresh"""
+
+    def __init__(self, claims: pd.DataFrame, cell_deg: float):
+        self.claims = claims.reset_index(drop=True)
+        self.lat = self.claims["latitude"].to_numpy(dtype=np.float64)
+        self.lon = self.claims["longitude"].to_numpy(dtype=np.float64)
+        self.claim_date = pd.to_datetime(self.claims["claim_date"]).to_numpy(dtype="datetime64[D]")
+
+        # Rows sorted by grid cell; a cell's rows are one contiguous slice of order
+        cells = self.cell_key(np.floor(self.lat / cell_deg), np.floor(self.lon / cell_deg))
+        self.order = np.argsort(cells, kind="stable")
+        self.sorted_cells = cells[self.order]
+
+    @staticmethod
+    def cell_key(row, col):
+        return (np.asarray(row, dtype=np.int64) + 100_000) * 1_000_000 + (np.asarray(col, dtype=np.int64) + 100_000)
+
+class ClaimsIndex:
+    """In-memory "claims within R km in the last N years" lookups over a claims snapshot"""
+
+    def __init__(self, claims: Optional[pd.DataFrame] = None, cell_deg: float = 0.05,
+                 key_column: str = "claim_id"):
+        self.cell_deg = cell_deg  # ~5.5km of latitude per cell
+        self.key_column = key_column
+        self._lock = threading.Lock()
+        self._stop_refresh = threading.Event()
+        if claims is None:
+            claims = pd.DataFrame({"latitude": [], "longitude": [], "claim_date": []})
+        self._snapshot = _Snapshot(self._normalize(claims), cell_deg)
+
+    def __len__(self) -> int:
+        return len(self._snapshot.claims)
+
+    @property
+    def watermark(self) -> Optional[date]:
+        """Latest claim_date in the snapshot"""
+        dates = self._snapshot.claim_date
+        return dates.max().astype(date) if len(dates) else None
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "ClaimsIndex":
+        return cls(pd.read_parquet(path), **kwargs)
+
+    def save(self, path: str):
+        self._snapshot.claims.to_parquet(path, index=False)
+
+    def count_within(self, lat: float, lon: float, radius_km: float = 5, years: int = 5,
+                     as_of: Optional[date] = None) -> int:
+        """Number of claims within radius_km of (lat, lon) in the last `years` years"""
+        return len(self._matching(self._snapshot, lat, lon, radius_km, years, as_of))
+
+    def claims_within(self, lat: float, lon: float, radius_km: float = 5, years: Optional[int] = None,
+                      as_of: Optional[date] = None, limit: Optional[int] = None) -> pd.DataFrame:
+        """Claims within radius_km of (lat, lon), newest first"""
+        snapshot = self._snapshot
+        rows = snapshot.claims.iloc[self._matching(snapshot, lat, lon, radius_km, years, as_of)]
+        rows = rows.sort_values("claim_date", ascending=False)
+        return rows.head(limit) if limit is not None else rows
+
+    def refresh(self, conn) -> int:
+        """Pull claims at or after the watermark from Snowflake; returns how many rows were new"""
+        watermark = self.watermark
+        cur = conn.cursor()
+        try:
+            if watermark is None:
+                cur.execute("SELECT * FROM claims_history")
+            else:
+                cur.execute("SELECT * FROM claims_history WHERE claim_date >= %(since)s", {"since": watermark})
+            delta = self._normalize(cur.fetch_pandas_all())
+        finally:
+            cur.close()
+
+        with self._lock:
+            before = len(self._snapshot.claims)
+            claims = pd.concat([self._snapshot.claims, delta], ignore_index=True)
+            if self.key_column in claims.columns:
+                claims = claims.drop_duplicates(subset=self.key_column, keep="last")
+            else:
+                claims = claims.drop_duplicates(keep="last")
+            self._snapshot = _Snapshot(claims, self.cell_deg)
+        added = len(self._snapshot.claims) - before
+        logger.info(f"Claims snapshot refreshed: {added} new claims, {len(self)} total")
+        return added
+
+    def refresh_every(self, connect: Callable, interval_s: float = 3600):
+        """Refresh in a daemon thread every interval_s seconds using connections from connect()"""
+        def loop():
+            while not self._stop_refresh.wait(interval_s):
+                try:
+                    conn = connect()
+                    try:
+                        self.refresh(conn)
+                    finally:
+                        conn.close()
+                except Exception as e:
+                    logger.warning(f"Claims snapshot refresh failed: {e}")
+
+        self._stop_refresh.clear()
+        threading.Thread(target=loop, name="claims-refresh", daemon=True).start()
+
+    def stop_refresh(self):
+        self._stop_refresh.set()
+
+    def _matching(self, snapshot: _Snapshot, lat: float, lon: float, radius_km: float,
+                  years: Optional[int], as_of: Optional[date]) -> np.ndarray:
+        """Row positions of claims within radius_km and, if given, the last `years` years"""
+        lat_span = radius_km / KM_PER_DEGREE
+        lon_span = radius_km / (KM_PER_DEGREE * max(np.cos(np.radians(lat)), 1e-6))
+        rows = np.arange(np.floor((lat - lat_span) / self.cell_deg), np.floor((lat + lat_span) / self.cell_deg) + 1)
+        cols = np.arange(np.floor((lon - lon_span) / self.cell_deg), np.floor((lon + lon_span) / self.cell_deg) + 1)
+        keys = _Snapshot.cell_key(*np.meshgrid(rows, cols)).ravel()
+
+        lo = np.searchsorted(snapshot.sorted_cells, keys, side="left")
+        hi = np.searchsorted(snapshot.sorted_cells, keys, side="right")
+        candidates = np.concatenate([snapshot.order[a:b] for a, b in zip(lo, hi)] or [np.empty(0, np.int64)])
+        if not len(candidates):
+            return candidates
+
+        keep = haversine_km(lat, lon, snapshot.lat[candidates], snapshot.lon[candidates]) <= radius_km
+        if years is not None:
+            today = np.datetime64(as_of or date.today(), "D")
+            cutoff = today - np.timedelta64(int(round(365.25 * years)), "D")
+            keep &= snapshot.claim_date[candidates] > cutoff
+        return candidates[keep]
+
+    @staticmethod
+    def _normalize(claims: pd.DataFrame) -> pd.DataFrame:
+        """Snowflake returns upper-case column names; index on lower-case ones"""
+        claims = claims.copy()
+        claims.columns = [str(c).lower() for c in claims.columns]
+        return claims
@@ -48,5 +48,5 @@ class Config:
         if missing:
             raise ValueError(f"Missing API keys for: {', '.join(missing)}")
 
-# Validate on import
-Config.validate()
\ No newline at end of file
+# Not validated on import: importing must stay cheap and must not fail for tools
+# that never reach a provider. Call Config.validate() before using live APIs.
\ No newline at end of file
@@ -0,0 +1,220 @@
+"""
+Buffered background writer for underwriting decisions.
+
+Decisions are appended to a local spool file and an in-memory buffer, and a
+background thread bulk-loads the buffer whenever it reaches max_batch records or
+flush_interval seconds have passed. At flush time the spool is rotated into a
+segment that is deleted only once its load succeeds, so a crash mid-batch loses
+nothing: leftover segments are reloaded on the next start. Delivery is
+at-least-once.
+
+Each process spools to its own file: "{pid}" in spool_path is replaced by the
+process id, and the sink holds an flock on "<spool>.lock" for its lifetime, so
+two processes can never share a spool. A new sink also adopts the spools of
+processes that died with decisions still pending. The spool is fsynced on
+rotation and flush (and on every submit with fsync_each), so acknowledged
+decisions survive a power loss once rotated.
+"""
+import fcntl
+import glob
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SPOOL_PATH = "decisions.spool.{pid}.jsonl"
+
+class BufferFull(Exception):
+    """Raised when the sink cannot accept a decision within the submit timeout"""
+
+class DecisionSink:
+    def __init__(self, write_batch: Callable[[pd.DataFrame], None],
+                 spool_path: str = DEFAULT_SPOOL_PATH, max_batch: int = 500,
+                 flush_interval: float = 5.0, max_pending: int = 10000,
+                 submit_timeout: Optional[float] = 1.0, fsync_each: bool = False):
+        self._write_batch = write_batch
+        self._spool_template = spool_path
+        self._spool_path = spool_path.replace("{pid}", str(os.getpid()))
+        self._fsync_each = fsync_each
+        self._owner = self._lock_spool(self._spool_path, blocking=False)
+        if self._owner is None:
+            raise RuntimeError(f"{self._spool_path} is in use by another process; "
+                               f"put {{pid}} in spool_path to give each process its own")
+        self._max_batch = max_batch
+        self._flush_interval = flush_interval
+        self._submit_timeout = submit_timeout
+
+        # Backpressure: one slot per decision not yet loaded
+        self._capacity = threading.BoundedSemaphore(max_pending)
+        self._cond = threading.Condition()
+        self._buffer: List[Dict] = []
+        # Pending loads as (segment path, decisions, capacity slots held)
+        self._segments: List[Tuple[str, List[Dict], int]] = self._recover()
+        self._load_lock = threading.Lock()
+        self._seq = 0
+        self._spool = open(self._spool_path, "a")
+        self._closed = False
+
+        self._thread = threading.Thread(target=self._run, name="decision-sink", daemon=True)
+        self._thread.start()
+
+    def submit(self, decision: Dict):
+        """Queue a decision for loading; blocks while the sink is at max_pending. Raises once closed."""
+        line = json.dumps(decision, default=str)
+        if not self._capacity.acquire(timeout=self._submit_timeout):
+            raise BufferFull(f"{self._spool_path} has too many decisions pending")
+        with self._cond:
+            # Checked under the lock close() sets it with, so nothing is appended after the final rotation
+            if self._closed:
+                self._capacity.release()
+                raise RuntimeError("DecisionSink is closed")
+            self._spool.write(line + "\n")
+            self._spool.flush()
+            if self._fsync_each:
+                os.fsync(self._spool.fileno())
+            self._buffer.append(decision)
+            if len(self._buffer) >= self._max_batch:
+                self._cond.notify()
+
+    def flush(self):
+        """Load everything buffered so far on the calling thread"""
+        with self._cond:
+            self._rotate()
+        self._load_segments()
+
+    def close(self):
+        """Stop the background thread after a final flush"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._spool.close()
+        if not self._segments:
+            # Nothing left for another process to adopt; the spool is empty after the final rotation
+            os.remove(self._spool_path)
+            os.remove(f"{self._spool_path}.lock")
+        self._owner.close()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self._flush_interval
+                while not self._closed and len(self._buffer) < self._max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                closed = self._closed
+                self._rotate()
+            self._load_segments()
+            if closed:
+                return
+
+    def _rotate(self):
+        """Move the buffered decisions and their spool lines into a pending segment (caller holds lock)"""
+        if not self._buffer:
+            return
+        self._spool.flush()
+        os.fsync(self._spool.fileno())
+        self._spool.close()
+        self._seq += 1
+        segment = f"{self._spool_path}.{os.getpid()}.{int(time.time() * 1000)}.{self._seq}"
+        os.replace(self._spool_path, segment)
+        _fsync_dir(segment)
+        self._spool = open(self._spool_path, "a")
+        self._segments.append((segment, self._buffer, len(self._buffer)))
+        self._buffer = []
+
+    def _load_segments(self):
+        """Bulk-load pending segments in order; a failed segment is retried on the next cycle"""
+        with self._load_lock:
+            while self._segments:
+                segment, batch, slots = self._segments[0]
+                try:
+                    self._write_batch(pd.DataFrame(batch))
+                except Exception as e:
+                    logger.error(f"Failed to load {len(batch)} decisions, will retry: {e}")
+                    return
+                os.remove(segment)
+                self._segments.pop(0)
+                for _ in range(slots):
+                    self._capacity.release()
+                logger.info(f"Loaded {len(batch)} underwriting decisions")
+
+    def _recover(self) -> List[Tuple[str, List[Dict], int]]:
+        """Pick up spool and segment files left by a previous process"""
+        self._adopt_orphans()
+        leftovers = sorted(path for path in glob.glob(f"{glob.escape(self._spool_path)}.*")
+                           if not path.endswith(".lock"))
+        if os.path.exists(self._spool_path):
+            recovered = f"{self._spool_path}.recovered.{int(time.time() * 1000)}"
+            os.replace(self._spool_path, recovered)
+            leftovers.append(recovered)
+
+        segments = []
+        for path in leftovers:
+            with open(path) as f:
+                # A torn final line means the writer died mid-write; that decision was never acknowledged
+                batch = []
+                for line in f:
+                    try:
+                        batch.append(json.loads(line))
+                    except json.JSONDecodeError:
+                        logger.warning(f"Skipping partial spool line in {path}")
+            if batch:
+                # Recovered decisions do not hold capacity slots, so a large backlog cannot block startup
+                segments.append((path, batch, 0))
+            else:
+                os.remove(path)
+        if segments:
+            logger.info(f"Recovered {sum(len(b) for _, b, _ in segments)} spooled decisions")
+        return segments
+
+    def _adopt_orphans(self):
+        """Move the spools of dead processes (their lock is free) under this sink's spool path"""
+        if "{pid}" not in self._spool_template:
+            return
+        pattern = glob.escape(self._spool_template).replace(glob.escape("{pid}"), "*") + ".lock"
+        for lock_path in glob.glob(pattern):
+            spool_path = lock_path[:-len(".lock")]
+            if spool_path == self._spool_path:
+                continue
+            lock = self._lock_spool(spool_path, blocking=False)
+            if lock is None:
+                continue  # its process is still running
+            try:
+                orphans = sorted(path for path in glob.glob(f"{glob.escape(spool_path)}*")
+                                 if path != lock_path)
+                stamp = int(time.time() * 1000)
+                for n, path in enumerate(orphans):
+                    os.replace(path, f"{self._spool_path}.adopted.{stamp}.{n}")
+                if orphans:
+                    _fsync_dir(self._spool_path)
+                    logger.info(f"Adopted {len(orphans)} spool files from {spool_path}")
+                os.remove(lock_path)
+            finally:
+                lock.close()
+
+    @staticmethod
+    def _lock_spool(spool_path: str, blocking: bool = True):
+        """Open and flock <spool>.lock; None when another process holds it"""
+        lock = open(f"{spool_path}.lock", "a")
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+        except BlockingIOError:
+            lock.close()
+            return None
+        return lock
+
+def _fsync_dir(path: str):
+    """Make a rename in path's directory durable"""
+    fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
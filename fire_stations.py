@@ -0,0 +1,171 @@
+"""
+Preloaded fire-station spatial index.
+
+Built once from a local OpenStreetMap extract and saved as a compact .npz file,
+then loaded at startup into a haversine BallTree so nearest-station and
+within-radius lookups are O(log n) and need no per-request Overpass call.
+
+The extract may be an Overpass JSON dump or GeoJSON, e.g. from a .osm.pbf.
+Stations mapped as building outlines (polygons) are indexed at their centroid.
+
+    osmium tags-filter us-latest.osm.pbf nwr/amenity=fire_station -o fs.osm.pbf
+    osmium export fs.osm.pbf -o fire_stations.geojson
+    python fire_stations.py fire_stations.geojson fire_stations.npz
+"""
+import argparse
+import json
+import logging
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from sklearn.neighbors import BallTree
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between coordinates; arrays broadcast and give an array of distances"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distance = 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+    return float(distance) if np.ndim(distance) == 0 else distance
+
+def _ring_centroid(ring) -> Tuple[float, float, float]:
+    """(lon, lat, signed area) of a closed ring by the shoelace formula, in degree units"""
+    xs, ys = np.asarray(ring, dtype=np.float64)[:, :2].T
+    cross = xs[:-1] * ys[1:] - xs[1:] * ys[:-1]
+    area = cross.sum() / 2
+    if area == 0:
+        return float(xs.mean()), float(ys.mean()), 0.0
+    return (float(((xs[:-1] + xs[1:]) * cross).sum() / (6 * area)),
+            float(((ys[:-1] + ys[1:]) * cross).sum() / (6 * area)), float(area))
+
+def geometry_point(geometry: Dict) -> Optional[Tuple[float, float]]:
+    """(lon, lat) of a GeoJSON Point, or the area-weighted centroid of a (Multi)Polygon's outer rings"""
+    kind, coordinates = geometry.get("type"), geometry.get("coordinates")
+    if not coordinates:
+        return None
+    if kind == "Point":
+        return coordinates[0], coordinates[1]
+    if kind == "Polygon":
+        rings = [coordinates[0]]
+    elif kind == "MultiPolygon":
+        rings = [polygon[0] for polygon in coordinates if polygon]
+    else:
+        return None
+    centroids = [_ring_centroid(ring) for ring in rings if len(ring) >= 3]
+    if not centroids:
+        return None
+    weights = np.abs([area for _, _, area in centroids])
+    if not weights.sum():
+        weights = np.ones(len(centroids))
+    lon = float(np.average([c[0] for c in centroids], weights=weights))
+    lat = float(np.average([c[1] for c in centroids], weights=weights))
+    return lon, lat
+
+class FireStationIndex:
+    """Nearest-k and within-radius fire station queries over a haversine BallTree"""
+
+    def __init__(self, lats: np.ndarray, lons: np.ndarray, ids: np.ndarray, names: np.ndarray):
+        self.lats = np.asarray(lats, dtype=np.float32)
+        self.lons = np.asarray(lons, dtype=np.float32)
+        self.ids = np.asarray(ids, dtype=np.int64)
+        self.names = np.asarray(names, dtype=str)
+        # BallTree rejects an empty dataset; an empty index answers every query with no stations
+        self._tree = BallTree(np.radians(np.column_stack([self.lats, self.lons]).astype(np.float64)),
+                              metric="haversine") if len(self.ids) else None
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def from_osm(cls, path: str) -> "FireStationIndex":
+        """Build from an Overpass JSON dump or a GeoJSON FeatureCollection"""
+        with open(path) as f:
+            data = json.load(f)
+
+        lats, lons, ids, names = [], [], [], []
+        if "elements" in data:
+            for element in data["elements"]:
+                # Ways and relations carry a center with "out center", or their outline with "out geom"
+                point = element if "lat" in element else element.get("center")
+                if not point and element.get("geometry"):
+                    outline = [[node["lon"], node["lat"]] for node in element["geometry"]]
+                    lon, lat = geometry_point({"type": "Polygon", "coordinates": [outline]}) or (None, None)
+                    point = {"lat": lat, "lon": lon} if lat is not None else None
+                if not point:
+                    continue
+                lats.append(point["lat"])
+                lons.append(point["lon"])
+                ids.append(element.get("id", 0))
+                names.append(element.get("tags", {}).get("name", ""))
+        else:
+            for feature in data.get("features", []):
+                point = geometry_point(feature.get("geometry") or {})
+                if point is None:
+                    continue
+                lon, lat = point
+                props = feature.get("properties") or {}
+                lats.append(lat)
+                lons.append(lon)
+                ids.append(int(str(feature.get("id", props.get("@id", 0))).split("/")[-1] or 0))
+                names.append(props.get("name", ""))
+
+        logger.info(f"Loaded {len(ids)} fire stations from {path}")
+        return cls(np.array(lats), np.array(lons), np.array(ids), np.array(names))
+
+    @classmethod
+    def load(cls, path: str) -> "FireStationIndex":
+        """Load an index saved with save()"""
+        with np.load(path) as data:
+            return cls(data["lat"], data["lon"], data["id"], data["name"])
+
+    def save(self, path: str):
+        np.savez_compressed(path, lat=self.lats, lon=self.lons, id=self.ids, name=self.names)
+
+    def nearest(self, lat: float, lon: float, k: int = 1) -> List[Tuple[float, Dict]]:
+        """The k closest stations as (distance_km, station) pairs, closest first"""
+        if not len(self):
+            return []
+        distances, indices = self.nearest_batch([lat], [lon], k)
+        return [(float(d), self._station(i)) for d, i in zip(distances[0], indices[0])]
+
+    def within_radius(self, lat: float, lon: float, radius_km: float) -> List[Tuple[float, Dict]]:
+        """Every station within radius_km as (distance_km, station) pairs, closest first"""
+        if not len(self):
+            return []
+        indices, distances = self._tree.query_radius(
+            np.radians([[lat, lon]]), r=radius_km / EARTH_RADIUS_KM, return_distance=True, sort_results=True
+        )
+        return [(float(d * EARTH_RADIUS_KM), self._station(i)) for d, i in zip(distances[0], indices[0])]
+
+    def nearest_batch(self, lats, lons, k: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Distances (km) and station positions of the k closest stations for each point, N x k"""
+        if not len(self):
+            return np.empty((len(lats), 0)), np.empty((len(lats), 0), dtype=np.int64)
+        distances, indices = self._tree.query(np.radians(np.column_stack([lats, lons])), k=min(k, len(self)))
+        return distances * EARTH_RADIUS_KM, indices
+
+    def count_within_batch(self, lats, lons, radius_km: float) -> np.ndarray:
+        """Number of stations within radius_km of each point"""
+        if not len(self):
+            return np.zeros(len(lats), dtype=np.int64)
+        return self._tree.query_radius(
+            np.radians(np.column_stack([lats, lons])), r=radius_km / EARTH_RADIUS_KM, count_only=True
+        )
+
+    def _station(self, i: int) -> Dict:
+        return {"id": int(self.ids[i]), "name": str(self.names[i]),
+                "lat": float(self.lats[i]), "lon": float(self.lons[i])}
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the fire station index from a local OSM extract")
+    parser.add_argument("extract", help="Overpass JSON or GeoJSON file of amenity=fire_station")
+    parser.add_argument("output", help="Index file to write (.npz)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    FireStationIndex.from_osm(args.extract).save(args.output)
+
+if __name__ == "__main__":
+    main()
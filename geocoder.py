@@ -0,0 +1,271 @@
+"""
+Offline geocoder over a local address / parcel table.
+
+Addresses are normalized (case, punctuation, street-type, directional and state
+abbreviations, unit numbers dropped) and looked up in a compact index saved as
+.npz: a sorted array of 64-bit key hashes for exact matches, plus the sorted
+keys themselves for a fallback when the query carries more or less of the
+city / state / ZIP than the table does. The fallback only matches the same
+street address with agreeing city / state / ZIP (at least one of them present
+on both sides), and gives up when more than one parcel fits.
+
+Build the index from an OpenAddresses-style CSV (NUMBER, STREET, CITY, REGION,
+POSTCODE, LAT, LON) or any CSV with address, latitude and longitude columns:
+
+    python geocoder.py us_west.csv addresses.npz
+"""
+import argparse
+import bisect
+import csv
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+STREET_TYPES = {
+    "street": "st", "avenue": "ave", "av": "ave", "boulevard": "blvd", "road": "rd", "drive": "dr",
+    "lane": "ln", "court": "ct", "place": "pl", "terrace": "ter", "parkway": "pkwy", "highway": "hwy",
+    "circle": "cir", "square": "sq", "trail": "trl", "way": "way", "alley": "aly", "expressway": "expy",
+    "freeway": "fwy", "plaza": "plz", "point": "pt", "route": "rte", "center": "ctr", "crossing": "xing",
+}
+DIRECTIONS = {
+    "north": "n", "south": "s", "east": "e", "west": "w",
+    "northeast": "ne", "northwest": "nw", "southeast": "se", "southwest": "sw",
+}
+STATES = {
+    "alabama": "al", "alaska": "ak", "arizona": "az", "arkansas": "ar", "california": "ca",
+    "colorado": "co", "connecticut": "ct", "delaware": "de", "florida": "fl", "georgia": "ga",
+    "hawaii": "hi", "idaho": "id", "illinois": "il", "indiana": "in", "iowa": "ia", "kansas": "ks",
+    "kentucky": "ky", "louisiana": "la", "maine": "me", "maryland": "md", "massachusetts": "ma",
+    "michigan": "mi", "minnesota": "mn", "mississippi": "ms", "missouri": "mo", "montana": "mt",
+    "nebraska": "ne", "nevada": "nv", "new hampshire": "nh", "new jersey": "nj", "new mexico": "nm",
+    "new york": "ny", "north carolina": "nc", "north dakota": "nd", "ohio": "oh", "oklahoma": "ok",
+    "oregon": "or", "pennsylvania": "pa", "rhode island": "ri", "south carolina": "sc",
+    "south dakota": "sd", "tennessee": "tn", "texas": "tx", "utah": "ut", "vermont": "vt",
+    "virginia": "va", "washington": "wa", "west virginia": "wv", "wisconsin": "wi", "wyoming": "wy",
+    "district of columbia": "dc",
+}
+_STATE_NAMES = re.compile(r"\b(" + "|".join(sorted(STATES, key=len, reverse=True)) + r")\b")
+# "apt 4b", "suite 100", "unit 12", "# 7" -- geocoded at the parcel, so the unit is dropped
+_UNIT = re.compile(r"(?:\b(?:apt|apartment|suite|ste|unit|floor|rm|room|bldg|building)\b|#)\s*#?\s*[\w-]+")
+_PUNCTUATION = re.compile(r"[^\w\s#]")
+MIN_PREFIX_TOKENS = 3  # number, street name and type at least
+STREET_SUFFIXES = set(STREET_TYPES.values())
+DIRECTION_CODES = set(DIRECTIONS.values())
+STATE_CODES = set(STATES.values())
+
+def normalize_address(address: str) -> str:
+    """Canonical lookup key: lower case, no punctuation or unit, USPS-style abbreviations"""
+    text = _PUNCTUATION.sub(" ", address.lower())
+    text = _UNIT.sub(" ", text)
+    # Spell out states only after the number / street / type, so "123 Washington Ave" survives
+    tokens = text.split()
+    if len(tokens) > MIN_PREFIX_TOKENS:
+        head, tail = " ".join(tokens[:MIN_PREFIX_TOKENS]), " ".join(tokens[MIN_PREFIX_TOKENS:])
+        text = f"{head} {_STATE_NAMES.sub(lambda m: STATES[m.group(1)], tail)}"
+    return " ".join(STREET_TYPES.get(t, DIRECTIONS.get(t, t)) for t in text.split())
+
+def split_address(key: str) -> Optional[Tuple[str, Tuple[Optional[str], Optional[str], Optional[str]]]]:
+    """
+    Split a normalized address into its street address (through the street type
+    and any trailing direction) and (city, state, ZIP); None without a street type.
+    """
+    tokens = key.split()
+    for i in range(MIN_PREFIX_TOKENS - 1, len(tokens)):
+        if tokens[i] in STREET_SUFFIXES:
+            end = i + 1
+            if end < len(tokens) and tokens[end] in DIRECTION_CODES:
+                end += 1
+            break
+    else:
+        return None
+    location = tokens[end:]
+    zip_code = next((t for t in location if t.isdigit() and len(t) == 5), None)
+    rest = [t for t in location if not t.isdigit()]
+    state = rest[-1] if rest and rest[-1] in STATE_CODES else None
+    city = " ".join(rest[:-1] if state else rest) or None
+    return " ".join(tokens[:end]), (city, state, zip_code)
+
+def locations_agree(a: Tuple, b: Tuple) -> bool:
+    """City / state / ZIP present on both sides are equal, and at least one is present on both"""
+    shared = [(x, y) for x, y in zip(a, b) if x is not None and y is not None]
+    return bool(shared) and all(x == y for x, y in shared)
+
+def key_hash(key: str) -> int:
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+
+class GeocodeResult(NamedTuple):
+    lat: float
+    lon: float
+    matched: str  # normalized table address that matched
+    precision: str  # "exact", or "prefix" when matched with more or less of the city / state / ZIP
+
+class _Keys:
+    """Read-only sequence view over keys packed into one byte blob (for bisect)"""
+
+    def __init__(self, blob: np.ndarray, offsets: np.ndarray):
+        self._blob = blob.tobytes()
+        self._offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    def __getitem__(self, i: int) -> str:
+        return self._blob[self._offsets[i]:self._offsets[i + 1]].decode()
+
+class Geocoder:
+    """Exact (hashed) and prefix lookups of normalized addresses, with an LRU of recent results"""
+
+    def __init__(self, keys: List[str], lats: np.ndarray, lons: np.ndarray, cache_size: int = 65536):
+        order = np.argsort(np.array(keys, dtype=object), kind="stable")
+        sorted_keys = [keys[i] for i in order]
+        encoded = [k.encode() for k in sorted_keys]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(k) for k in encoded])
+        self._init(np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets,
+                   np.asarray(lats, dtype=np.float64)[order], np.asarray(lons, dtype=np.float64)[order], cache_size)
+
+    def _init(self, blob: np.ndarray, offsets: np.ndarray, lats: np.ndarray, lons: np.ndarray,
+              cache_size: int, hashes: Optional[np.ndarray] = None):
+        self._keys = _Keys(blob, offsets)
+        self._blob, self._offsets = blob, offsets
+        self.lats, self.lons = lats, lons
+        if hashes is None:
+            hashes = np.array([key_hash(self._keys[i]) for i in range(len(self._keys))], dtype=np.int64)
+        self._hashes = hashes
+        self._hash_order = np.argsort(hashes, kind="stable")
+        self._sorted_hashes = hashes[self._hash_order]
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Optional[GeocodeResult]]" = OrderedDict()
+        self._lock = threading.Lock()
+        # "ambiguous" counts fallback lookups that fit several parcels; they are also "unmatched"
+        self.stats = {"hits": 0, "misses": 0, "exact": 0, "prefix": 0, "unmatched": 0, "ambiguous": 0}
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    @classmethod
+    def from_csv(cls, path: str, **kwargs) -> "Geocoder":
+        """Build from an OpenAddresses CSV or a CSV with address / latitude / longitude columns"""
+        keys, lats, lons = [], [], []
+        with open(path, newline="") as f:
+            for row in csv.DictReader(f):
+                row = {k.lower(): v for k, v in row.items() if k}
+                if "address" in row:
+                    address = row["address"]
+                else:
+                    parts = [row.get("number"), row.get("street"), row.get("city"), row.get("region"), row.get("postcode")]
+                    address = " ".join(p for p in parts if p)
+                lat, lon = row.get("lat", row.get("latitude")), row.get("lon", row.get("longitude"))
+                if not address or not lat or not lon:
+                    continue
+                keys.append(normalize_address(address))
+                lats.append(float(lat))
+                lons.append(float(lon))
+        logger.info(f"Loaded {len(keys)} addresses from {path}")
+        return cls(keys, np.array(lats), np.array(lons), **kwargs)
+
+    @classmethod
+    def load(cls, path: str, cache_size: int = 65536) -> "Geocoder":
+        """Load an index saved with save()"""
+        geocoder = cls.__new__(cls)
+        with np.load(path) as data:
+            geocoder._init(data["blob"], data["offsets"], data["lat"], data["lon"], cache_size, data["hash"])
+        return geocoder
+
+    def save(self, path: str):
+        np.savez_compressed(path, blob=self._blob, offsets=self._offsets,
+                            lat=self.lats, lon=self.lons, hash=self._hashes)
+
+    def geocode(self, address: str) -> Optional[GeocodeResult]:
+        return self.geocode_many([address])[0]
+
+    def geocode_many(self, addresses: Iterable[str]) -> List[Optional[GeocodeResult]]:
+        """Geocode a whole portfolio; cached addresses are skipped and the rest are hashed in one pass"""
+        addresses = list(addresses)
+        found: Dict[str, Optional[GeocodeResult]] = {}
+        with self._lock:
+            for address in addresses:
+                if address in self._cache:
+                    self._cache.move_to_end(address)
+                    found[address] = self._cache[address]
+                    self.stats["hits"] += 1
+        misses = [a for a in dict.fromkeys(addresses) if a not in found]
+        if misses:
+            keys = [normalize_address(a) for a in misses]
+            rows = self._exact_rows(keys)
+            for address, key, row in zip(misses, keys, rows):
+                found[address] = self._result(row, "exact") if row >= 0 else self._prefix_match(key)
+            with self._lock:
+                self.stats["misses"] += len(misses)
+                for address in misses:
+                    result = found[address]
+                    self.stats[result.precision if result else "unmatched"] += 1
+                    self._cache[address] = result
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return [found[a] for a in addresses]
+
+    def _exact_rows(self, keys: List[str]) -> np.ndarray:
+        """Table row of each key, or -1"""
+        hashes = np.array([key_hash(k) for k in keys], dtype=np.int64)
+        positions = np.searchsorted(self._sorted_hashes, hashes)
+        rows = np.full(len(keys), -1, dtype=np.int64)
+        for i, (key, h, pos) in enumerate(zip(keys, hashes, positions)):
+            # Walk equal hashes and compare keys, so a 64-bit collision cannot return the wrong parcel
+            while pos < len(self._sorted_hashes) and self._sorted_hashes[pos] == h:
+                row = self._hash_order[pos]
+                if self._keys[row] == key:
+                    rows[i] = row
+                    break
+                pos += 1
+        return rows
+
+    def _prefix_match(self, key: str) -> Optional[GeocodeResult]:
+        """
+        Fallback for a query with more or less of the city / state / ZIP than the
+        table: the one parcel at the same street address whose location agrees.
+        None when the query has no location, or when several parcels fit.
+        """
+        parts = split_address(key)
+        if parts is None or not any(parts[1]):
+            return None  # a bare street address can be in any city
+        street, location = parts
+        rows = []
+        pos = bisect.bisect_left(self._keys, street)
+        while pos < len(self._keys):
+            candidate = self._keys[pos]
+            if candidate != street and not candidate.startswith(street + " "):
+                break
+            other = split_address(candidate)
+            if other is not None and other[0] == street and locations_agree(location, other[1]):
+                rows.append(pos)
+            pos += 1
+        if not rows:
+            return None
+        if len({(self.lats[row], self.lons[row]) for row in rows}) > 1:
+            with self._lock:
+                self.stats["ambiguous"] += 1
+            logger.debug(f"{key!r} fits {len(rows)} parcels; not geocoding it")
+            return None
+        return self._result(rows[0], "prefix")
+
+    def _result(self, row: int, precision: str) -> GeocodeResult:
+        return GeocodeResult(float(self.lats[row]), float(self.lons[row]), self._keys[row], precision)
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the offline geocoder index from an address CSV")
+    parser.add_argument("addresses", help="OpenAddresses CSV or CSV with address, latitude, longitude")
+    parser.add_argument("output", help="Index file to write (.npz)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    Geocoder.from_csv(args.addresses).save(args.output)
+
+if __name__ == "__main__":
+    main()
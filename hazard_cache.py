@@ -0,0 +1,210 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Tuple
+
+logger = logging.getLogger(__name__)
+
+# How long a provider payload stays fresh (seconds). Hazard maps change on the
+# scale of months; claims move faster.
+DAY = 24 * 60 * 60
+DEFAULT_TTLS = {
+    "hazardhub": 30 * DAY,
+    "fema": 90 * DAY,
+    "usgs": 365 * DAY,
+    "overpass": 30 * DAY,
+    "attom": 30 * DAY,
+    "claims": 1 * DAY,
+}
+# Last good peril results ("result:<peril>" rows) are kept as stale fallbacks
+# past any provider TTL, but not forever
+RESULT_RETENTION = 90 * DAY
+RESULT_PREFIX = "result:"
+# Expired rows are purged from disk when a cache is opened and after every PURGE_EVERY puts
+PURGE_EVERY = 1000
+
+_GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+
+def geohash(lat: float, lon: float, precision: int = 7) -> str:
+    """Encode a coordinate as a geohash; precision 7 is a ~150m cell, 6 is ~1.2km"""
+    lat_range = [-90.0, 90.0]
+    lon_range = [-180.0, 180.0]
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # geohash interleaves bits starting with longitude
+    while len(chars) < precision:
+        rng, value = (lon_range, lon) if even else (lat_range, lat)
+        mid = (rng[0] + rng[1]) / 2
+        if value >= mid:
+            bits = (bits << 1) | 1
+            rng[0] = mid
+        else:
+            bits <<= 1
+            rng[1] = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(_GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+class HazardCache:
+    """
+    Persistent provider-response cache keyed by quantized geo cell.
+
+    A bounded in-memory LRU sits in front of a local SQLite store so warm entries
+    survive restarts and deploys. Freshness is checked on read against the
+    provider's TTL, so changing a TTL applies to entries already on disk.
+
+    The SQLite calls block; async callers use the a-prefixed methods, which run
+    them on a worker thread instead of the event loop.
+    """
+
+    def __init__(self, path: str = "hazard_cache.sqlite3", precision: int = 7,
+                 ttls: Optional[Dict[str, float]] = None, max_entries: int = 10000,
+                 result_retention: float = RESULT_RETENTION):
+        self.precision = precision
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.result_retention = result_retention
+        self.max_entries = max_entries
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+        self._memory: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")  # lets several workers share one file
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS hazard_cache (
+                provider TEXT NOT NULL,
+                cell TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                payload TEXT NOT NULL,
+                PRIMARY KEY (provider, cell)
+            )
+        """)
+        self._db.commit()
+        self._puts = 0
+        self.purge_expired()
+
+    def cell(self, lat: float, lon: float) -> str:
+        """Cache key for a coordinate at the configured precision"""
+        return geohash(lat, lon, self.precision)
+
+    def get(self, provider: str, key: str) -> Optional[Any]:
+        """Return the fresh payload cached for (provider, key), or None"""
+        now = time.time()
+        ttl = self.ttls.get(provider, 0)
+        with self._lock:
+            entry = self._memory.get((provider, key))
+            if entry is None:
+                row = self._db.execute(
+                    "SELECT fetched_at, payload FROM hazard_cache WHERE provider = ? AND cell = ?",
+                    (provider, key)
+                ).fetchone()
+                if row is not None:
+                    entry = (row[0], json.loads(row[1]))
+                    self._remember((provider, key), entry)
+            else:
+                self._memory.move_to_end((provider, key))
+
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            if now - entry[0] > ttl:
+                self.stats["expirations"] += 1
+                self.stats["misses"] += 1
+                self._memory.pop((provider, key), None)
+                self._db.execute("DELETE FROM hazard_cache WHERE provider = ? AND cell = ?", (provider, key))
+                self._db.commit()
+                return None
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def get_stale(self, provider: str, key: str) -> Optional[Tuple[Any, float]]:
+        """(payload, age in seconds) for (provider, key) regardless of TTL, or None; for degraded fallbacks"""
+        with self._lock:
+            entry = self._memory.get((provider, key))
+            if entry is None:
+                row = self._db.execute(
+                    "SELECT fetched_at, payload FROM hazard_cache WHERE provider = ? AND cell = ?",
+                    (provider, key)
+                ).fetchone()
+                if row is None:
+                    return None
+                entry = (row[0], json.loads(row[1]))
+        return entry[1], time.time() - entry[0]
+
+    def put(self, provider: str, key: str, payload: Any):
+        """Store a provider payload for (provider, key)"""
+        entry = (time.time(), payload)
+        with self._lock:
+            self._remember((provider, key), entry)
+            self._db.execute(
+                "INSERT OR REPLACE INTO hazard_cache (provider, cell, fetched_at, payload) VALUES (?, ?, ?, ?)",
+                (provider, key, entry[0], json.dumps(payload))
+            )
+            self._db.commit()
+            self._puts += 1
+            purge = self._puts % PURGE_EVERY == 0
+        if purge:
+            self.purge_expired()
+
+    def get_geo(self, provider: str, lat: float, lon: float) -> Optional[Any]:
+        return self.get(provider, self.cell(lat, lon))
+
+    def put_geo(self, provider: str, lat: float, lon: float, payload: Any):
+        self.put(provider, self.cell(lat, lon), payload)
+
+    async def aget(self, provider: str, key: str) -> Optional[Any]:
+        return await asyncio.to_thread(self.get, provider, key)
+
+    async def aget_stale(self, provider: str, key: str) -> Optional[Tuple[Any, float]]:
+        return await asyncio.to_thread(self.get_stale, provider, key)
+
+    async def aput(self, provider: str, key: str, payload: Any):
+        await asyncio.to_thread(self.put, provider, key, payload)
+
+    def purge_expired(self) -> int:
+        """Delete stale provider rows and result rows past their retention from disk; returns how many were removed"""
+        now = time.time()
+        removed = 0
+        with self._lock:
+            for provider, ttl in self.ttls.items():
+                removed += self._db.execute(
+                    "DELETE FROM hazard_cache WHERE provider = ? AND fetched_at < ?",
+                    (provider, now - ttl)
+                ).rowcount
+            removed += self._db.execute(
+                "DELETE FROM hazard_cache WHERE substr(provider, 1, ?) = ? AND fetched_at < ?",
+                (len(RESULT_PREFIX), RESULT_PREFIX, now - self.result_retention)
+            ).rowcount
+            for key in [key for key, entry in self._memory.items()
+                        if key[0].startswith(RESULT_PREFIX) and now - entry[0] > self.result_retention]:
+                del self._memory[key]
+            self._db.commit()
+            self.stats["expirations"] += removed
+        if removed:
+            logger.info(f"Purged {removed} expired hazard cache entries")
+        return removed
+
+    def hit_rate(self) -> float:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def _remember(self, key: Tuple[str, str], entry: Tuple[float, Any]):
+        """Insert into the in-memory LRU, evicting the least recently used entry when full"""
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats["evictions"] += 1
@@ -0,0 +1,74 @@
+"""
+Import-time budget for the InsurIQ entry points.
+
+Each entry point is imported in a fresh interpreter with -X importtime; the check
+fails when its cumulative import time exceeds the budget or when it pulls in a
+dependency that must stay lazy. Run it in CI:
+
+    python import_budget.py          # exits 1 on any regression
+"""
+import subprocess
+import sys
+from typing import Dict, List, Tuple
+
+# Milliseconds, best of RUNS. Generous enough for a loaded CI box; a regression
+# back to eager model/graph loading costs seconds.
+BUDGETS_MS = {
+    "config": 150,
+    "rag_system": 150,
+    "main": 600,
+}
+
+# Modules an entry point must not import until a request needs them
+MUST_STAY_LAZY = {
+    "config": [],
+    "rag_system": ["faiss", "langchain_community", "sentence_transformers", "torch"],
+    "main": ["langgraph", "streamlit", "pandas", "numpy", "faiss", "langchain_community", "torch"],
+}
+
+RUNS = 3
+
+def import_time_ms(module: str) -> float:
+    """Cumulative import time of module in a fresh interpreter, best of RUNS"""
+    best = float("inf")
+    for _ in range(RUNS):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True, text=True, check=True
+        )
+        for line in proc.stderr.splitlines():
+            # "import time: self [us] | cumulative | imported package"
+            parts = [p.strip() for p in line.split("|")]
+            if len(parts) == 3 and parts[2] == module:
+                best = min(best, int(parts[1]) / 1000)
+    return best
+
+def eagerly_imported(module: str, forbidden: List[str]) -> List[str]:
+    """Which of forbidden are already in sys.modules right after importing module"""
+    if not forbidden:
+        return []
+    proc = subprocess.run(
+        [sys.executable, "-c", f"import sys, {module}; print(' '.join(sys.modules))"],
+        capture_output=True, text=True, check=True
+    )
+    loaded = set(proc.stdout.split())
+    return [name for name in forbidden if name in loaded]
+
+def check() -> Dict[str, Tuple[float, float, List[str]]]:
+    """Measured time, budget and eager imports for every entry point"""
+    return {
+        module: (import_time_ms(module), budget, eagerly_imported(module, MUST_STAY_LAZY[module]))
+        for module, budget in BUDGETS_MS.items()
+    }
+
+def main():
+    failed = False
+    for module, (elapsed, budget, eager) in check().items():
+        ok = elapsed <= budget and not eager
+        failed |= not ok
+        note = f" eagerly imports {', '.join(eager)}" if eager else ""
+        print(f"{'ok  ' if ok else 'FAIL'} {module:<12} {elapsed:7.1f} ms / {budget} ms{note}")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -1,71 +1,214 @@
+"""
+InsurIQ underwriting UI.
+
+Streamlit re-runs this script on every interaction, so everything expensive is
+cached: the runtime (compiled graph, RiskAPIs, retriever) and the job manager
+live in st.cache_resource and are shared by all sessions, and uploaded
+portfolios are parsed once per file in st.cache_data. Submissions run as
+background jobs; the page only polls their progress, so it never blocks on a
+provider. Polling fragments run only while a job is active: when it finishes
+they rerun the page once, which draws the outcome without a polling fragment.
+
+    streamlit run insur_iq_app.py
+"""
+import io
 import streamlit as st
-from langgraph_app import app  # Our compiled workflow
 import pandas as pd
 import plotly.express as px
+from jobs import CANCELLED, DONE, FAILED, JobManager
+from main import get_runtime
+from scoring import PERILS, format_score
+
+POLL_INTERVAL = "1s"
+PORTFOLIO_PREVIEW_ROWS = 20
+
+@st.cache_resource(show_spinner="Starting underwriting engine...")
+def runtime():
+    """Process-wide runtime with the graph compiled before the first submission"""
+    engine = get_runtime()
+    engine.app
+    return engine
+
+@st.cache_resource
+def job_manager() -> JobManager:
+    return JobManager(runtime())
+
+@st.cache_data(show_spinner="Reading portfolio...", max_entries=8)
+def read_portfolio(data: bytes, name: str) -> pd.DataFrame:
+    """Parse an uploaded CSV or Parquet book once per file content"""
+    if name.endswith(".parquet"):
+        return pd.read_parquet(io.BytesIO(data))
+    return pd.read_csv(io.BytesIO(data))
+
+# ------------------------------
+# Single submission
+# ------------------------------
+
+def submission_form():
+    with st.form("underwriting_form"):
+        st.subheader("Property Information")
+
+        col1, col2 = st.columns(2)
+        with col1:
+            property_id = st.text_input("Property ID", "PROP-123")
+            property_type = st.selectbox("Property Type", ["Residential", "Commercial", "Industrial"])
+            address = st.text_area("Address", "123 Main St, Los Angeles, CA")
+
+        with col2:
+            construction_type = st.selectbox("Construction Type", ["Wood", "Concrete", "Steel"])
+            year_built = st.number_input("Year Built", min_value=1800, max_value=2025, value=1990)
+            floors = st.number_input("Number of Floors", min_value=1, max_value=100, value=2)
+
+        # File upload for document processing
+        uploaded_files = st.file_uploader("Upload supporting documents", accept_multiple_files=True)
+
+        submitted = st.form_submit_button("Submit for Underwriting")
+
+    if submitted:
+        inputs = {
+            "property_id": property_id,
+            "property_type": property_type,
+            "address": address,
+            "construction_type": construction_type,
+            "year_built": int(year_built),
+            "floors": int(floors),
+            "documents": [doc.getvalue() for doc in uploaded_files or []]
+        }
+        # Identical inputs return the running or finished job instead of a new one
+        st.session_state["submission_job"] = job_manager().submit(inputs).id
+
+def submission_status():
+    job = job_manager().get(st.session_state.get("submission_job"))
+    if job is None:
+        return
+    if job.active:
+        submission_progress(job.id)
+        return
+    snapshot = job.snapshot()
+    if snapshot["status"] == FAILED:
+        st.error(f"Underwriting failed: {snapshot['error']}")
+    else:
+        show_result(snapshot["result"], snapshot["elapsed"])
+
+@st.fragment(run_every=POLL_INTERVAL)
+def submission_progress(job_id: str):
+    job = job_manager().get(job_id)
+    if job is None or not job.active:
+        st.rerun()  # the full run draws the outcome and stops this fragment polling
+    snapshot = job.snapshot()
+    st.progress(min(snapshot["done"] / max(snapshot["total"], 1), 1.0),
+                text=f"Underwriting... {snapshot['done']}/{snapshot['total']} steps")
+    for node, seconds in snapshot["completed"]:
+        st.caption(f"✓ {node.replace('_', ' ')} ({seconds:.2f}s)")
+
+def show_result(result: dict, elapsed: float):
+    st.success(f"Underwriting Complete! ({elapsed:.1f}s)")
+
+    # Score visualization
+    st.subheader("Risk Assessment")
+    risk_df = pd.DataFrame({
+        "Score": pd.Series(result["risk_scores"]),
+        "Confidence": pd.Series(result.get("risk_confidence", {})),
+    })
+    fig = px.bar(risk_df, y="Score", hover_data=["Confidence"], title="Risk Scores Breakdown")
+    st.plotly_chart(fig)
+    if result.get("skipped_perils"):
+        st.caption(f"Not assessed (decision already settled): {', '.join(result['skipped_perils'])}")
+    if result.get("degraded_perils"):
+        st.caption(f"Scored from fallbacks: {', '.join(result['degraded_perils'])}")
+
+    # NATCAT score gauge
+    # With perils skipped the score is only bounded; show the range, not the partial sum
+    low, high = result["natcat_bounds"]
+    st.metric("NATCAT Score", f"{format_score(low, high)}/100",
+              delta_color="inverse" if low > 50 else "normal",
+              help="Range the score lies in whatever the unassessed perils score" if high > low else None)
+
+    # Decision
+    st.subheader("Underwriting Decision")
+    if result["decision"]["status"] == "STP":
+        st.success("✅ Straight Through Processing (STP) Eligible")
+    else:
+        st.warning("⚠️ Requires Manual Underwriting Review")
+
+    # Full report
+    with st.expander("View Detailed Report"):
+        st.write(result["report"])
+
+    # Download option
+    st.download_button("Download Report", result["report"],
+                       file_name=f"{result['inputs'].get('property_id') or 'property'}_report.txt")
+
+# ------------------------------
+# Portfolio
+# ------------------------------
+
+def portfolio_upload():
+    upload = st.file_uploader("Portfolio (CSV or Parquet)", type=["csv", "parquet"], key="portfolio_file")
+    if upload is None:
+        return
+    book = read_portfolio(upload.getvalue(), upload.name)
+    missing = {"address", "year_built"} - set(book.columns)
+    if missing:
+        st.error(f"Portfolio is missing columns: {', '.join(sorted(missing))}")
+        return
+    st.caption(f"{len(book)} properties")
+    st.dataframe(book.head(PORTFOLIO_PREVIEW_ROWS), hide_index=True)
+    if st.button("Underwrite portfolio", type="primary"):
+        rows = book.where(book.notna(), None).to_dict("records")
+        st.session_state["portfolio_job"] = job_manager().submit_portfolio(rows).id
+
+def portfolio_status():
+    job = job_manager().get(st.session_state.get("portfolio_job"))
+    if job is None:
+        return
+    if job.active:
+        portfolio_progress(job.id)
+    else:
+        show_portfolio(job)
+
+@st.fragment(run_every=POLL_INTERVAL)
+def portfolio_progress(job_id: str):
+    job = job_manager().get(job_id)
+    if job is None or not job.active:
+        st.rerun()  # the full run draws the final table and stops this fragment polling
+    show_portfolio(job)
+
+def show_portfolio(job):
+    snapshot = job.snapshot()
+    counts = snapshot["counts"]
+    st.progress(min(snapshot["done"] / max(snapshot["total"], 1), 1.0),
+                text=f"{snapshot['done']}/{snapshot['total']} properties ({snapshot['status']}, "
+                     f"{snapshot['elapsed']:.0f}s)")
+    col1, col2, col3 = st.columns(3)
+    col1.metric("STP", counts["STP"])
+    col2.metric("Referred", counts["Referred"])
+    col3.metric("Errors", counts["errors"])
+
+    table = pd.DataFrame(snapshot["rows"])
+    columns = ["row", "property_id", "address", "status", "natcat", "decision", *PERILS, "error"]
+    st.dataframe(table.reindex(columns=columns), hide_index=True)
+
+    if job.active:
+        if st.button("Cancel", key=f"cancel_{job.id}"):
+            job.cancel()
+    elif snapshot["status"] in (DONE, CANCELLED):
+        st.download_button("Download results", table.to_csv(index=False),
+                           file_name="underwriting_results.csv", mime="text/csv")
+    else:
+        st.error(f"Portfolio failed: {snapshot['error']}")
+
+def render():
+    st.title("InsurIQ - AI-Powered Underwriting")
+    runtime()
+
+    single, portfolio = st.tabs(["Single property", "Portfolio"])
+    with single:
+        submission_form()
+        submission_status()
+    with portfolio:
+        portfolio_upload()
+        portfolio_status()
 
-# App title
-st.title("InsurIQ - AI-Powered Underwriting")
-
-# Input form
-with st.form("underwriting_form"):
-    st.subheader("Property Information")
-
-    col1, col2 = st.columns(2)
-    with col1:
-        property_id = st.text_input("Property ID")
-        property_type = st.selectbox("Property Type", ["Residential", "Commercial", "Industrial"])
-        address = st.text_area("Address")
-
-    with col2:
-        construction_type = st.selectbox("Construction Type", ["Wood", "Concrete", "Steel"])
-        year_built = st.number_input("Year Built", min_value=1800, max_value=2025)
-        floors = st.number_input("Number of Floors", min_value=1, max_value=100)
-
-    # File upload for document processing
-    uploaded_files = st.file_uploader("Upload supporting documents", accept_multiple_files=True)
-
-    submitted = st.form_submit_button("Submit for Underwriting")
-
-if submitted:
-    # Prepare inputs
-    inputs = {
-        "property_id": property_id,
-        "property_type": property_type,
-        "address": address,
-        "construction_type": construction_type,
-        "year_built": year_built,
-        "floors": floors,
-        "documents": [doc.read() for doc in uploaded_files]
-    }
-
-    # Run the workflow
-    with st.spinner("Processing underwriting request..."):
-        result = app.invoke({"inputs": inputs})
-
-        # Display results
-        st.success("Underwriting Complete!")
-
-        # Score visualization
-        st.subheader("Risk Assessment")
-        risk_df = pd.DataFrame.from_dict(result["risk_scores"], orient="index", columns=["Score"])
-        fig = px.bar(risk_df, y="Score", title="Risk Scores Breakdown")
-        st.plotly_chart(fig)
-
-        # NATCAT score gauge
-        st.metric("NATCAT Score", f"{result['natcat_score']}/100",
-                  delta_color="inverse" if result['natcat_score'] > 50 else "normal")
-
-        # Decision
-        st.subheader("Underwriting Decision")
-        decision = result["decision"]
-        if decision["status"] == "STP":
-            st.success("✅ Straight Through Processing (STP) Eligible")
-        else:
-            st.warning("⚠️ Requires Manual Underwriting Review")
-
-        # Full report
-        with st.expander("View Detailed Report"):
-            st.write(result["report"])
-
-        # Download option
-        st.download_button("Download Report", result["report"], file_name=f"{property_id}_report.txt")
\ No newline at end of file
+if __name__ == "__main__":
+    render()
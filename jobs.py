@@ -0,0 +1,203 @@
+"""
+Background underwriting jobs for the UI.
+
+A JobManager runs single submissions and portfolio files on worker threads so
+the page that started them stays responsive; the page polls job.snapshot() to
+draw progress. Submissions report every workflow node as it finishes, and
+portfolios report each row as it completes. Submissions are kept by their form
+inputs, so resubmitting the same form returns the running job, or the finished
+one while it is younger than the node memo's TTL, instead of underwriting again.
+"""
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Tuple
+from scoring import PERILS, format_score
+
+logger = logging.getLogger(__name__)
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+
+def inputs_key(inputs: Dict) -> Tuple:
+    """Form inputs that determine the result; property_id is only a label"""
+    return tuple(sorted((k, v if not isinstance(v, list) else tuple(v))
+                        for k, v in inputs.items() if k != "property_id"))
+
+class Job:
+    """State of one background job, updated by its worker and read by the UI"""
+
+    def __init__(self, kind: str, total: int):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind  # "submission" or "portfolio"
+        self.status = QUEUED
+        self.total = total  # nodes of a submission, rows of a portfolio
+        self.completed: List[Tuple[str, float]] = []  # (node or row label, seconds since start)
+        self.rows: Dict[int, Dict] = {}  # portfolio row -> flattened record
+        self.counts = {"STP": 0, "Referred": 0, "errors": 0}
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def active(self) -> bool:
+        return self.status in (QUEUED, RUNNING)
+
+    def cancel(self):
+        """Stop a portfolio after the rows already in flight"""
+        self._cancel.set()
+
+    def snapshot(self) -> Dict:
+        """Consistent copy of the job's progress for rendering"""
+        with self._lock:
+            elapsed = ((self.finished or time.time()) - self.started) if self.started else 0.0
+            return {"id": self.id, "kind": self.kind, "status": self.status, "total": self.total,
+                    "done": len(self.completed), "completed": list(self.completed),
+                    "rows": [self.rows[i] for i in sorted(self.rows)], "counts": dict(self.counts),
+                    "result": self.result, "error": self.error, "elapsed": elapsed}
+
+    def _start(self):
+        with self._lock:
+            self.status, self.started = RUNNING, time.time()
+
+    def _progress(self, label: str):
+        with self._lock:
+            self.completed.append((label, time.time() - self.started))
+
+    def _finish(self, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        with self._lock:
+            self.status, self.result, self.error = status, result, error
+            self.finished = time.time()
+
+def flatten_record(record: Dict) -> Dict:
+    """batch.underwrite_row record as a flat table row (peril scores instead of results)"""
+    row = {key: value for key, value in record.items() if key != "results"}
+    if record["natcat_low"] is not None:
+        row["natcat"] = format_score(record["natcat_low"], record["natcat_high"])  # a range when perils were skipped
+    for peril in PERILS:
+        result = record["results"].get(peril)
+        row[peril] = result.score if result else None
+    return row
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps the most recent ones"""
+
+    def __init__(self, runtime=None, workers: int = 4, portfolio_workers: int = 8, max_jobs: int = 200,
+                 reuse_ttl: Optional[float] = None):
+        self._runtime = runtime
+        if reuse_ttl is None:
+            from main import Config
+            reuse_ttl = Config.MEMO_TTL  # a finished result is as fresh as the node results behind it
+        self.reuse_ttl = reuse_ttl
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ui-job")
+        self.portfolio_workers = portfolio_workers
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._by_inputs: Dict[Tuple, str] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def runtime(self):
+        if self._runtime is None:
+            from main import get_runtime
+            self._runtime = get_runtime()
+        return self._runtime
+
+    def get(self, job_id: Optional[str]) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id) if job_id else None
+
+    def submit(self, inputs: Dict) -> Job:
+        """Underwrite one submission in the background, reusing a running or finished job for the same inputs"""
+        key = inputs_key(inputs)
+        total = len(self.runtime.node_names)
+        # Lookup and insert under one lock, so identical concurrent submissions share a job
+        with self._lock:
+            existing = self._jobs.get(self._by_inputs.get(key))
+            if existing is not None and (existing.active or (
+                    existing.status == DONE and time.time() - existing.finished <= self.reuse_ttl)):
+                return existing
+            job = self._insert(Job("submission", total), key)
+        self._executor.submit(self._run_submission, job, inputs)
+        return job
+
+    def submit_portfolio(self, rows: List[Dict]) -> Job:
+        """Underwrite portfolio rows (batch.py input format) in the background"""
+        job = self._add(Job("portfolio", len(rows)))
+        with job._lock:
+            job.rows = {i: {"row": i, "property_id": str(row.get("property_id", "")),
+                            "address": row.get("address"), "status": QUEUED} for i, row in enumerate(rows)}
+        self._executor.submit(self._run_portfolio, job, rows)
+        return job
+
+    def shutdown(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        for job in jobs:
+            job.cancel()
+        self._executor.shutdown(wait=False)
+
+    def _add(self, job: Job) -> Job:
+        with self._lock:
+            return self._insert(job)
+
+    def _insert(self, job: Job, key: Optional[Tuple] = None) -> Job:
+        """Add job (under self._lock), dropping the oldest finished jobs beyond max_jobs"""
+        self._jobs[job.id] = job
+        if key is not None:
+            self._by_inputs[key] = job.id
+        while len(self._jobs) > self.max_jobs:
+            old_id, old = next(iter(self._jobs.items()))
+            if old.active:
+                break  # never drop a job that is still running
+            del self._jobs[old_id]
+            self._by_inputs = {k: v for k, v in self._by_inputs.items() if v != old_id}
+        return job
+
+    def _run_submission(self, job: Job, inputs: Dict):
+        job._start()
+        try:
+            state = self.runtime.invoke(inputs, on_node=lambda name, update: job._progress(name))
+        except Exception as e:
+            logger.error(f"Underwriting job {job.id} failed: {e}")
+            job._finish(FAILED, error=str(e))
+            return
+        job._finish(DONE, result=state)
+
+    def _run_portfolio(self, job: Job, rows: List[Dict]):
+        from batch import iter_underwritten
+
+        job._start()
+        records = iter_underwritten(self._until_cancelled(job, rows), self.portfolio_workers)
+        try:
+            for record in records:
+                row = flatten_record(record)
+                row["status"] = FAILED if record["error"] else DONE
+                with job._lock:
+                    job.rows[record["row"]] = row
+                    job.counts["errors" if record["error"] else record["decision"]] += 1
+                job._progress(f"row {record['row']}")
+        except Exception as e:
+            logger.error(f"Portfolio job {job.id} failed: {e}")
+            job._finish(FAILED, error=str(e))
+            return
+        if job._cancel.is_set():
+            with job._lock:
+                for row in job.rows.values():
+                    if row["status"] == QUEUED:
+                        row["status"] = CANCELLED
+            job._finish(CANCELLED)
+        else:
+            job._finish(DONE)
+
+    @staticmethod
+    def _until_cancelled(job: Job, rows: Iterable[Dict]) -> Iterable[Dict]:
+        for row in rows:
+            if job._cancel.is_set():
+                return
+            yield row
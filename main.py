@@ -1,13 +1,18 @@
 # main.py
-from langgraph.graph import StateGraph, END
-from typing import TypedDict, Optional, Dict
-from pydantic import BaseModel
+# Heavy dependencies (langgraph, numpy, pandas, streamlit) are imported where they
+# are first needed so importing this module stays cheap; see import_budget.py.
+from contextvars import ContextVar
+from datetime import date
+from typing import TypedDict, Optional, Dict, Annotated, List, Callable
 from enum import Enum
+import functools
 import logging
 import os
+import threading
+import time
 from dotenv import load_dotenv
-import pandas as pd
-import streamlit as st
+# Providers return compact PerilResults; RiskAssessmentResult is their pydantic form for API responses
+from results import PerilResult, RiskAssessmentResult
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -58,6 +63,52 @@ class Config:
         "claims": 0.05
     }
 
+    # Workflow concurrency: how many graph nodes may run at once per submission,
+    # and how many in-flight provider calls each peril branch allows process-wide
+    MAX_CONCURRENCY = int(os.getenv("INSURIQ_MAX_CONCURRENCY", "6"))
+    PERIL_CONCURRENCY = {
+        peril: int(os.getenv(f"INSURIQ_{peril.upper()}_CONCURRENCY", "8"))
+        for peril in RISK_WEIGHTS
+    }
+
+    # Guideline retrieval: "mock" for the built-in demo retriever, "faiss" for the
+    # cached embedding search over underwriting_guidelines/ in rag_system.py
+    GUIDELINES_BACKEND = os.getenv("INSURIQ_GUIDELINES", "mock")
+
+    # Node latency / error metrics (metrics.py); trace spans are enabled separately with INSURIQ_TRACE=1
+    METRICS = os.getenv("INSURIQ_METRICS", "1") == "1"
+
+    # Offline geocoder index built with geocoder.py; unresolved addresses are
+    # scored at FALLBACK_COORDINATES (Los Angeles) only to fill the report, and
+    # always referred for manual review
+    GEOCODER_INDEX = os.getenv("INSURIQ_GEOCODER_INDEX", "addresses.npz")
+    FALLBACK_COORDINATES = (34.0522, -118.2437)
+
+    # Seconds one submission may spend waiting on risk providers (resilience.py);
+    # perils that cannot be answered in time use degraded fallbacks
+    LATENCY_BUDGET = float(os.getenv("INSURIQ_LATENCY_BUDGET", "15"))
+
+    # Peril evaluation: "full" runs every peril branch in parallel; "lazy" runs them
+    # one at a time, best weight-to-latency first, and stops once the STP/Referred
+    # decision can no longer change
+    EVALUATION = os.getenv("INSURIQ_EVALUATION", "full")
+
+    # Node memoization: peril results are reused for this many seconds while the
+    # extracted_data fields the node reads are unchanged (0 disables it)
+    MEMO_TTL = float(os.getenv("INSURIQ_MEMO_TTL", "900"))
+    MEMO_SIZE = int(os.getenv("INSURIQ_MEMO_SIZE", "10000"))
+
+    # Risk providers: "api" for the async provider client in api.py, "mock" for the
+    # fixed demo scores of MockRiskAPIs (tests and offline demos only)
+    RISK_CLIENT = os.getenv("INSURIQ_RISK_CLIENT", "api")
+    # Local data behind the api client; each is used only when its file exists
+    # (HAZARD_CACHE is created on first use; set it to "" to disable caching)
+    HAZARD_CACHE = os.getenv("INSURIQ_HAZARD_CACHE", "hazard_cache.sqlite3")
+    FIRE_STATION_INDEX = os.getenv("INSURIQ_FIRE_STATIONS", "fire_stations.npz")
+    CLAIMS_INDEX = os.getenv("INSURIQ_CLAIMS_INDEX", "claims_index.parquet")
+    # Seconds between pulls of new claims from Snowflake into the loaded claims index (0 disables)
+    CLAIMS_REFRESH_INTERVAL = float(os.getenv("INSURIQ_CLAIMS_REFRESH_S", "3600"))
+
     @classmethod
     def validate(cls):
         pass
@@ -76,23 +127,31 @@ class RiskType(str, Enum):
     CONSTRUCTION = "construction"
     CLAIMS = "claims"
 
-class RiskAssessmentResult(BaseModel):
-    score: float  # Risk score between 0-5
-    confidence: float  # Confidence score between 0-1
-    factors: Dict[str, float]  # Contributing factors to the score
-    raw_data: Dict  # Raw API response data
+def merge_risk_scores(left: Optional[dict], right: Optional[dict]) -> dict:
+    """Reducer so parallel peril branches each contribute their own key"""
+    return {**(left or {}), **(right or {})}
+
+def concat_lists(left: Optional[list], right: Optional[list]) -> list:
+    """Reducer so parallel branches can each append entries"""
+    return (left or []) + (right or [])
 
 class AgentState(TypedDict):
     inputs: dict  # Raw input data
     extracted_data: dict  # Processed structured data
-    risk_scores: dict  # Individual risk scores
-    natcat_score: float  # Final composite score
+    risk_scores: Annotated[dict, merge_risk_scores]  # Individual risk scores
+    risk_confidence: Annotated[dict, merge_risk_scores]  # Confidence (0-1) of each score; low when degraded
+    risk_results: Annotated[dict, merge_risk_scores]  # PerilResult (score, confidence, factors) per peril
+    skipped_perils: list  # Perils lazy evaluation did not need to assess
+    degraded_perils: Annotated[list, concat_lists]  # Perils scored from a fallback instead of a provider
+    reused_nodes: Annotated[list, concat_lists]  # Nodes answered from the memo of an earlier submission
+    natcat_score: float  # Final composite score; the lower bound when perils were skipped
+    natcat_bounds: tuple  # (low, high) the true score lies in; equal unless perils were skipped
     decision: dict  # Underwriting decision
     report: str  # Final report
 
-# Risk API Client
-class RiskAPIs:
-    """Central class for all external risk assessment API integrations"""
+# Mock Risk API Client
+class MockRiskAPIs:
+    """Fixed demo scores with the api.RiskAPIs interface; selected with INSURIQ_RISK_CLIENT=mock"""
     def __init__(self, snowflake_config: Dict):
         pass
        # self.sf_conn = None  # Initialize as None
@@ -112,7 +171,7 @@ class RiskAPIs:
         # }
 
 
-    def get_flood_risk(self, lat: float, lon: float, has_basement: bool) -> Optional[RiskAssessmentResult]:
+    def get_flood_risk(self, lat: float, lon: float, has_basement: bool) -> Optional[PerilResult]:
         try:
             # TODO: Implement actual FEMA API call
             # Example implementation (commented out):
@@ -135,7 +194,7 @@ class RiskAPIs:
             # Current mock implementation
             zone_score = 3.0
             basement_penalty = 1.5 if has_basement else 1.0
-            return RiskAssessmentResult(
+            return PerilResult(
                 score=min(zone_score * basement_penalty, 5),
                 confidence=0.85,
                 factors={
@@ -148,7 +207,10 @@ class RiskAPIs:
             logger.error(f"Flood risk assessment failed: {e}")
             return None
 
-    def get_fire_risk(self, lat: float, lon: float, construction_type: str) -> Optional[RiskAssessmentResult]:
+    def new_submission(self):
+        return None
+
+    def get_fire_risk(self, lat: float, lon: float, construction_type: str, ctx=None) -> Optional[PerilResult]:
         try:
             # TODO: Implement actual HazardHub/Google Maps API calls for:
             # - Fire station proximity
@@ -160,7 +222,7 @@ class RiskAPIs:
             construction_factor = self._get_construction_factor(construction_type)
             composite_score = (distance * 0.4 + wildfire_score * 0.4) * construction_factor
 
-            return RiskAssessmentResult(
+            return PerilResult(
                 score=min(composite_score, 5),
                 confidence=0.9,
                 factors={
@@ -174,13 +236,13 @@ class RiskAPIs:
             logger.error(f"Fire risk assessment failed: {e}")
             return None
 
-    def get_windstorm_risk(self, lat: float, lon: float) -> Optional[RiskAssessmentResult]:
+    def get_windstorm_risk(self, lat: float, lon: float, ctx=None) -> Optional[PerilResult]:
         try:
             # TODO: Implement actual HazardHub API call for windstorm data
             # Would fetch hurricane, tornado, and hail risk scores
 
             # Current mock implementation
-            return RiskAssessmentResult(
+            return PerilResult(
                 score=3.0,
                 confidence=0.8,
                 factors={
@@ -194,13 +256,13 @@ class RiskAPIs:
             logger.error(f"Windstorm risk assessment failed: {e}")
             return None
 
-    def get_earthquake_risk(self, lat: float, lon: float) -> Optional[RiskAssessmentResult]:
+    def get_earthquake_risk(self, lat: float, lon: float) -> Optional[PerilResult]:
         try:
             # TODO: Implement actual USGS API call for seismic data
             # Would fetch PGA (Peak Ground Acceleration) values
 
             # Current mock implementation
-            return RiskAssessmentResult(
+            return PerilResult(
                 score=1.5,
                 confidence=0.75,
                 factors={"pga": 0.3},  # Mock PGA value
@@ -210,13 +272,13 @@ class RiskAPIs:
             logger.error(f"Earthquake risk assessment failed: {e}")
             return None
 
-    def get_construction_risk(self, address: str) -> Optional[RiskAssessmentResult]:
+    def get_construction_risk(self, address: str) -> Optional[PerilResult]:
         try:
             # TODO: Implement actual ATTOM API call for property details
             # Would fetch roof condition, year built, etc.
 
             # Current mock implementation
-            return RiskAssessmentResult(
+            return PerilResult(
                 score=2.0,
                 confidence=0.7,
                 factors={
@@ -229,7 +291,7 @@ class RiskAPIs:
             logger.error(f"Construction risk assessment failed: {e}")
             return None
 
-    def get_claims_risk(self, lat: float, lon: float) -> Optional[RiskAssessmentResult]:
+    def get_claims_risk(self, lat: float, lon: float) -> Optional[PerilResult]:
         try:
             # TODO: Implement actual Snowflake query for historical claims data
             # Example implementation (commented out):
@@ -249,7 +311,7 @@ class RiskAPIs:
 
             # Current mock implementation
             claim_count = 2  # Mock value
-            return RiskAssessmentResult(
+            return PerilResult(
                 score=min(claim_count, 5),  # Cap score at 5
                 confidence=0.9,
                 factors={"nearby_claims": claim_count},
@@ -308,19 +370,30 @@ def setup_rag():
 
     return MockRetriever()
 
-
-guidelines_retriever = setup_rag()
-
 def get_relevant_guidelines(query):
-    docs = guidelines_retriever.get_relevant_documents(query)
+    docs = current_runtime().retriever.invoke(query)
     return "\n\n".join(doc.page_content for doc in docs)
 
-# Workflow Definition
-
-workflow = StateGraph(AgentState)
-
-# Instantiate RiskAPIs once and reuse
-risk_client = RiskAPIs(Config.SNOWFLAKE_CONFIG)
+def get_guidelines_for(queries: List[str]) -> Dict[str, str]:
+    """Guideline text per query, resolved in one batched lookup when the retriever supports it"""
+    retriever = current_runtime().retriever
+    if hasattr(retriever, "search_many"):
+        docs_by_query = retriever.search_many(queries)
+    else:
+        docs_by_query = {query: retriever.invoke(query) for query in queries}
+    return {query: "\n\n".join(doc.page_content for doc in docs) for query, docs in docs_by_query.items()}
+
+def guideline_queries(state: AgentState) -> List[str]:
+    """General guidelines plus one query per risk driver present in this submission"""
+    data = state["extracted_data"]
+    queries = ["Property underwriting guidelines"]
+    if state["risk_scores"].get("flood", 0) >= 3 or data.get("has_basement"):
+        queries.append("Flood zone property requirements")
+    if str(data.get("construction_type", "")).lower() == "wood":
+        queries.append("Wood construction risk factor")
+    if date.today().year - int(data.get("year_built") or date.today().year) > 30:
+        queries.append("Building age structural review")
+    return queries
 
 #@workflow.add_node
 def input_processing(state: AgentState) -> AgentState:
@@ -330,67 +403,281 @@ def input_processing(state: AgentState) -> AgentState:
         "construction_type": inputs["construction_type"],
         "year_built": inputs["year_built"],
         "floors": inputs["floors"],
-        "has_basement": True,
-        "lat": 34.0522,  # Mock coordinates (Los Angeles)
-        "lon": -118.2437
+        "has_basement": True
     }
     return {"extracted_data": extracted}
 #workflow.add_node("input_processing", input_processing)
 
 #@workflow.add_node
 def geocoding(state: AgentState) -> AgentState:
-    return {"extracted_data": {**state["extracted_data"], "lat": 34.0522, "lon": -118.2437}}
+    data = state["extracted_data"]
+    geocoder = current_runtime().geocoder
+    match = geocoder.geocode(data["address"]) if geocoder is not None else None
+    if match is None:
+        logger.warning(f"Could not geocode {data['address']!r}; using fallback coordinates")
+        (lat, lon), precision = Config.FALLBACK_COORDINATES, "fallback"
+    else:
+        lat, lon, precision = match.lat, match.lon, match.precision
+    return {"extracted_data": {**data, "lat": lat, "lon": lon, "geocode_precision": precision}}
 #workflow.add_node("geocoding", geocoding)
 
 
+class PerilCosts:
+    """Running mean latency of each peril assessment, for ordering lazy evaluation"""
+
+    def __init__(self, alpha: float = 0.2):
+        self.alpha = alpha
+        self._seconds: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, peril: str, seconds: float):
+        with self._lock:
+            previous = self._seconds.get(peril)
+            self._seconds[peril] = seconds if previous is None else previous + self.alpha * (seconds - previous)
+
+    def order(self, weights: Dict[str, float]) -> List[str]:
+        """Perils by weight per second of latency, highest first; unseen perils cost the mean of the seen ones"""
+        with self._lock:
+            seconds = dict(self._seconds)
+        prior = sum(seconds.values()) / len(seconds) if seconds else 1.0
+        return sorted(weights, key=lambda peril: -weights[peril] / max(seconds.get(peril, prior), 1e-6))
+
+_peril_costs = PerilCosts()
+
+class NodeMemo:
+    """
+    State updates of memoizable nodes keyed by the extracted_data fields they
+    read, so resubmitting a property with one field changed only re-runs the
+    nodes that read that field. Entries expire after ttl seconds; least recently
+    used ones are evicted beyond maxsize.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 10000):
+        from collections import OrderedDict
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()  # key -> (stored_at, update)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0}
+
+    def get(self, key: tuple) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() - entry[0] > self.ttl:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: tuple, update: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), update)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+def memoized(name: str, node: Callable, fields: tuple, memo: NodeMemo) -> Callable:
+    """Serve node from memo while the fields it reads are unchanged; degraded results are not kept"""
+    @functools.wraps(node)
+    def wrapper(state: AgentState) -> AgentState:
+        data = state["extracted_data"]
+        key = (name,) + tuple(data.get(field) for field in fields)
+        update = memo.get(key)
+        if update is not None:
+            return {**update, "reused_nodes": [name]}
+        update = node(state)
+        if not update.get("degraded_perils"):
+            memo.put(key, update)
+        return update
+    return wrapper
+
+# Each peril branch holds a slot while it talks to its provider so a burst of
+# submissions cannot open unbounded connections to one upstream
+_peril_slots = {
+    peril: threading.BoundedSemaphore(limit)
+    for peril, limit in Config.PERIL_CONCURRENCY.items()
+}
+
+def peril_branch(peril: str):
+    """Limit concurrent executions of a peril node across all submissions"""
+    def decorator(node):
+        @functools.wraps(node)
+        def wrapper(state: AgentState) -> AgentState:
+            with _peril_slots[peril]:
+                return node(state)
+        return wrapper
+    return decorator
+
+def reads(*fields: str):
+    """Declare the extracted_data fields a node depends on, which makes it memoizable"""
+    def decorator(node):
+        node.reads = fields
+        return node
+    return decorator
+
+def peril_result(peril: str, result: Optional[PerilResult], data: dict) -> AgentState:
+    """State update for one peril; a missing result scores the regional default at low confidence"""
+    if result is None:
+        from resilience import regional_default
+        score, confidence = regional_default(peril, data.get("lat"), data.get("lon"))
+        logger.warning(f"No {peril} result, using the regional default")
+        result = PerilResult(score, confidence, fallback="regional_default")
+    update = {"risk_scores": {peril: result.score}, "risk_confidence": {peril: result.confidence},
+              "risk_results": {peril: result}}
+    if result.fallback:
+        update["degraded_perils"] = [peril]
+    return update
+
 #@workflow.add_node
+@reads("lat", "lon", "construction_type")
+@peril_branch("fire")
 def fire_risk_assessment(state: AgentState) -> AgentState:
     data = state["extracted_data"]
-    result = risk_client.get_fire_risk(data["lat"], data["lon"], data["construction_type"])
-    return {"risk_scores": {"fire": result.score if result else 0}}
+    result = current_runtime().risk_client.get_fire_risk(data["lat"], data["lon"], data["construction_type"],
+                                                         current_submission())
+    return peril_result("fire", result, data)
 #workflow.add_node("fire_risk_assessment", fire_risk_assessment)
 
 #@workflow.add_node
+@reads("lat", "lon", "has_basement")
+@peril_branch("flood")
 def flood_risk_assessment(state: AgentState) -> AgentState:
     data = state["extracted_data"]
-    result = risk_client.get_flood_risk(data["lat"], data["lon"], data.get("has_basement", False))
-    return {"risk_scores": {"flood": result.score if result else 0}}
+    result = current_runtime().risk_client.get_flood_risk(data["lat"], data["lon"], data.get("has_basement", False))
+    return peril_result("flood", result, data)
 #workflow.add_node("flood_risk_assessment", flood_risk_assessment)
 
 #@workflow.add_node
+@reads("lat", "lon")
+@peril_branch("windstorm")
 def windstorm_risk_assessment(state: AgentState) -> AgentState:
     data = state["extracted_data"]
-    result = risk_client.get_windstorm_risk(data["lat"], data["lon"])
-    return {"risk_scores": {"windstorm": result.score if result else 0}}
+    result = current_runtime().risk_client.get_windstorm_risk(data["lat"], data["lon"], current_submission())
+    return peril_result("windstorm", result, data)
 #workflow.add_node("windstorm_risk_assessment", windstorm_risk_assessment)
 
+@reads("lat", "lon")
+@peril_branch("earthquake")
+def earthquake_risk_assessment(state: AgentState) -> AgentState:
+    data = state["extracted_data"]
+    result = current_runtime().risk_client.get_earthquake_risk(data["lat"], data["lon"])
+    return peril_result("earthquake", result, data)
+
+@reads("address")
+@peril_branch("construction")
+def construction_risk_assessment(state: AgentState) -> AgentState:
+    data = state["extracted_data"]
+    result = current_runtime().risk_client.get_construction_risk(data["address"])
+    return peril_result("construction", result, data)
+
+@reads("lat", "lon")
+@peril_branch("claims")
+def claims_risk_assessment(state: AgentState) -> AgentState:
+    data = state["extracted_data"]
+    result = current_runtime().risk_client.get_claims_risk(data["lat"], data["lon"])
+    return peril_result("claims", result, data)
+
+# Peril -> node name; every branch fans out from geocoding and joins at natcat_aggregation
+PERIL_NODES = {
+    "fire": "fire_risk_assessment",
+    "flood": "flood_risk_assessment",
+    "windstorm": "windstorm_risk_assessment",
+    "earthquake": "earthquake_risk_assessment",
+    "construction": "construction_risk_assessment",
+    "claims": "claims_risk_assessment",
+}
+
+def lazy_peril_assessment(assessments: Dict[str, Callable]) -> Callable:
+    """
+    Node running the peril assessments one at a time in cost order, stopping as
+    soon as the score bounds settle the decision; the rest go to skipped_perils.
+    """
+    def assess_perils(state: AgentState) -> AgentState:
+        import scoring
+        update = {"risk_scores": {}, "risk_confidence": {}, "skipped_perils": []}
+        order = _peril_costs.order(Config.RISK_WEIGHTS)
+        for i, peril in enumerate(order):
+            started = time.perf_counter()
+            result = assessments[peril](state)
+            if not result.get("reused_nodes"):  # memo hits say nothing about provider latency
+                _peril_costs.observe(peril, time.perf_counter() - started)
+            for key, value in result.items():
+                if isinstance(value, dict):
+                    update.setdefault(key, {}).update(value)
+                else:
+                    update.setdefault(key, []).extend(value)
+            low, high = scoring.score_bounds(update["risk_scores"], Config.RISK_WEIGHTS)
+            if i + 1 < len(order) and scoring.settled_decision(low, high) is not None:
+                update["skipped_perils"] = order[i + 1:]
+                break
+        return update
+    return assess_perils
+
 #@workflow.add_node
 def natcat_aggregation(state: AgentState) -> AgentState:
-    weights = Config.RISK_WEIGHTS
-    score = sum(state["risk_scores"].get(k, 0)*v for k,v in weights.items()) * 20  # Scale 0-100
-    return {"natcat_score": score}
+    import scoring
+    # Same kernel the portfolio path uses, on a 1 x 6 matrix; skipped perils may
+    # still score anywhere in 0-5, so the true score is only bounded
+    skipped = state.get("skipped_perils") or []
+    known = {peril: state["risk_scores"].get(peril) or 0.0 for peril in scoring.PERILS if peril not in skipped}
+    low, high = scoring.score_bounds(known, Config.RISK_WEIGHTS)  # Scale 0-100
+    return {"natcat_score": low, "natcat_bounds": (low, high)}
 #workflow.add_node("natcat_aggregation", natcat_aggregation)
 
 #@workflow.add_node
 def decision_engine(state: AgentState) -> AgentState:
-    decision = "STP" if state["natcat_score"] < 50 else "Referred"
+    import scoring
+    decision = str(scoring.decisions([state["natcat_score"]])[0])
+    if state["extracted_data"].get("geocode_precision") == "fallback":
+        # Location perils were scored at placeholder coordinates, so the score says nothing about this property
+        return {"decision": {"status": "Referred",
+                             "reason": "Address could not be geocoded; location risk scores are placeholders"}}
+    skipped = state.get("skipped_perils") or []
+    if skipped:
+        low, high = state["natcat_bounds"]
+        reason = (f"Composite risk score is {low:.1f}-{high:.1f} whatever the "
+                  f"{len(skipped)} unassessed perils score")
+        return {"decision": {"status": decision, "reason": reason}}
     return {"decision": {"status": decision, "reason": "Based on composite risk score"}}
 #workflow.add_node("decision_engine", decision_engine)
 
 #@workflow.add_node
 def report_generation(state: AgentState) -> AgentState:
-    guidelines = get_relevant_guidelines("Property underwriting guidelines")
+    # Identical passages returned for several queries are only listed once
+    guidelines = "\n\n".join(dict.fromkeys(get_guidelines_for(guideline_queries(state)).values()))
    # workflow.add_node("report_generation", report_generation)
+    confidence = state.get("risk_confidence", {})
+    skipped = state.get("skipped_perils") or []
+    breakdown = "\n".join(
+        f"- {peril.title()}: not assessed (decision already settled)" if peril in skipped else
+        f"- {peril.title()}: {state['risk_scores'].get(peril, 0):.1f}/5 (confidence {confidence.get(peril, 0):.0%})"
+        for peril in PERIL_NODES
+    )
+    reused_nodes = state.get("reused_nodes") or []
+    reused = f"Reused from an earlier submission: {', '.join(sorted(reused_nodes))}\n" if reused_nodes else ""
+    # Offloaded provider payloads are referenced, not inlined; see payload_store.py
+    refs = [(peril, result.raw_ref) for peril, result in state.get("risk_results", {}).items() if result.raw_ref]
+    payloads = "Provider Payloads:\n" + "".join(f"- {peril.title()}: {ref}\n" for peril, ref in refs) if refs else ""
+    import scoring
+    natcat = f"{scoring.format_score(*state['natcat_bounds'])}/100"
+    if skipped:
+        natcat += f" (bounds; {len(skipped)} perils not assessed)"
+    location = ""
+    if state["extracted_data"].get("geocode_precision") == "fallback":
+        location = "Location: address not geocoded; location perils scored at fallback coordinates\n"
     report = f"""
-NATCAT Score: {state['natcat_score']:.1f}/100
+{location}NATCAT Score: {natcat}
 Risk Breakdown:
-- Fire: {state['risk_scores'].get('fire', 0):.1f}/5
-- Flood: {state['risk_scores'].get('flood', 0):.1f}/5
-- Windstorm: {state['risk_scores'].get('windstorm', 0):.1f}/5
+{breakdown}
 
 Underwriting Decision: {state['decision']['status']}
 Reason: {state['decision']['reason']}
-
+{reused}{payloads}
 Guidelines Reference:
 {guidelines}
 """
@@ -400,94 +687,232 @@ Guidelines Reference:
 # 3. Build the Graph
 # ------------------------------
 
-#workflow = StateGraph(AgentState)
-
-
-
-
-workflow.add_node("input_processing", input_processing)
-workflow.add_node("geocoding", geocoding)
-workflow.add_node("fire_risk_assessment", fire_risk_assessment)
-workflow.add_node("flood_risk_assessment", flood_risk_assessment)
-workflow.add_node("windstorm_risk_assessment", windstorm_risk_assessment)
-workflow.add_node("natcat_aggregation", natcat_aggregation)
-workflow.add_node("decision_engine", decision_engine)
-workflow.add_node("report_generation", report_generation)
-
+# Wraps a node before it is added to the graph: node_hook(name, node) -> node
+NodeHook = Callable[[str, Callable], Callable]
+
+def build_workflow(node_hook: Optional[NodeHook] = None, evaluation: str = "full",
+                   memo: Optional[NodeMemo] = None):
+    """
+    Wire the underwriting StateGraph; InsurIQ compiles it on first use.
+    node_hook, when given, wraps every node (timing, metrics, tracing).
+    evaluation "lazy" replaces the parallel peril branches with lazy_peril_assessment.
+    memo, when given, memoizes the nodes declared with @reads.
+    """
+    from langgraph.graph import StateGraph, END
+
+    workflow = StateGraph(AgentState)
+
+    nodes = {
+        "input_processing": input_processing,
+        "geocoding": geocoding,
+        "fire_risk_assessment": fire_risk_assessment,
+        "flood_risk_assessment": flood_risk_assessment,
+        "windstorm_risk_assessment": windstorm_risk_assessment,
+        "earthquake_risk_assessment": earthquake_risk_assessment,
+        "construction_risk_assessment": construction_risk_assessment,
+        "claims_risk_assessment": claims_risk_assessment,
+        "natcat_aggregation": natcat_aggregation,
+        "decision_engine": decision_engine,
+        "report_generation": report_generation,
+    }
+    if memo is not None:
+        nodes = {name: memoized(name, node, node.reads, memo) if hasattr(node, "reads") else node
+                 for name, node in nodes.items()}
+    if node_hook:
+        nodes = {name: node_hook(name, node) for name, node in nodes.items()}
+    if evaluation == "lazy":
+        assessments = {peril: nodes.pop(node_name) for peril, node_name in PERIL_NODES.items()}
+        lazy = lazy_peril_assessment(assessments)
+        nodes["peril_assessment"] = node_hook("peril_assessment", lazy) if node_hook else lazy
+    for name, node in nodes.items():
+        workflow.add_node(name, node)
+
+    # ------------------------------
+    # 4. Define Edges
+    # ------------------------------
+
+    workflow.set_entry_point("input_processing")
+
+    workflow.add_edge("input_processing", "geocoding")
+    if evaluation == "lazy":
+        workflow.add_edge("geocoding", "peril_assessment")
+        workflow.add_edge("peril_assessment", "natcat_aggregation")
+    else:
+        # Fan out: every peril only reads extracted_data, so they run in the same superstep
+        for node_name in PERIL_NODES.values():
+            workflow.add_edge("geocoding", node_name)
+        # Fan in: natcat_aggregation waits for all peril branches
+        workflow.add_edge(list(PERIL_NODES.values()), "natcat_aggregation")
+    workflow.add_edge("natcat_aggregation", "decision_engine")
+    workflow.add_edge("decision_engine", "report_generation")
+    workflow.add_edge("report_generation", END)
+    return workflow
+
+# Per-invocation config; pass to app.invoke so the fan-out honours MAX_CONCURRENCY
+RUN_CONFIG = {"max_concurrency": Config.MAX_CONCURRENCY}
 
 # ------------------------------
-# 4. Define Edges
+# 5. Runtime
 # ------------------------------
 
-workflow.set_entry_point("input_processing")
-
-# workflow.add_edge("input_processing", "geocoding")
-# workflow.add_edge("geocoding", "risk_assessment")
-# workflow.add_edge("risk_assessment", "weather_fetch")
-# workflow.add_edge("weather_fetch", "fetch_property_details")
-# workflow.add_edge("fetch_property_details", "fetch_snowflake_data")
-# workflow.add_edge("fetch_snowflake_data", "report_generation")
-# workflow.add_edge("report_generation", END)
-
-workflow.add_edge("input_processing", "geocoding")
-workflow.add_edge("geocoding", "fire_risk_assessment")
-workflow.add_edge("fire_risk_assessment", "windstorm_risk_assessment")
-workflow.add_edge("windstorm_risk_assessment", "flood_risk_assessment")
-workflow.add_edge("flood_risk_assessment", "natcat_aggregation")
-workflow.add_edge("natcat_aggregation", "decision_engine")
-workflow.add_edge("decision_engine", "report_generation")
-workflow.add_edge("report_generation", END)
-#workflow.set_finish_point("report_generation")
-app = workflow.compile()
+# Runtime executing the current invocation; nodes resolve their clients through it
+_active_runtime: ContextVar[Optional["InsurIQ"]] = ContextVar("insuriq_runtime", default=None)
+# Provider responses of the current invocation, shared by the peril nodes that need the same payload
+_active_submission: ContextVar[Optional[object]] = ContextVar("insuriq_submission", default=None)
+
+def _connect_snowflake():
+    """New Snowflake connection for background jobs (claims index refresh)"""
+    import snowflake.connector
+    return snowflake.connector.connect(**Config.SNOWFLAKE_CONFIG)
+
+class InsurIQ:
+    """
+    Owns the compiled workflow, risk client and guideline retriever.
+
+    Each resource is built on first use and then reused for the life of the
+    process, so importing this module, a Streamlit rerun or a worker start pays
+    nothing until a submission actually needs it.
+    """
+
+    def __init__(self, risk_client=None, retriever=None, geocoder=None, node_hook: Optional[NodeHook] = None,
+                 evaluation: Optional[str] = None, memoize: Optional[bool] = None):
+        self._resources = {"risk_client": risk_client, "retriever": retriever, "geocoder": geocoder}
+        self.evaluation = evaluation or Config.EVALUATION
+        memoize = Config.MEMO_TTL > 0 if memoize is None else memoize
+        self.memo = NodeMemo(Config.MEMO_TTL, Config.MEMO_SIZE) if memoize else None
+        if node_hook is None and Config.METRICS:
+            from metrics import instrument_node
+            node_hook = instrument_node
+        self._node_hook = node_hook
+        self._lock = threading.RLock()
+
+    @property
+    def risk_client(self):
+        """api.RiskAPIs, or MockRiskAPIs when Config.RISK_CLIENT is mock"""
+        return self._resource("risk_client", self._build_risk_client)
+
+    @property
+    def retriever(self):
+        return self._resource("retriever", self._build_retriever)
+
+    @property
+    def geocoder(self):
+        """The offline geocoder, or None when no index is installed"""
+        return self._resource("geocoder", self._build_geocoder) or None
+
+    @property
+    def app(self):
+        """The compiled StateGraph"""
+        return self._resource("app", lambda: build_workflow(self._node_hook, self.evaluation, self.memo).compile())
+
+    def invoke(self, inputs: dict, on_node: Optional[Callable[[str, dict], None]] = None) -> AgentState:
+        """Underwrite one submission; on_node(name, update) is called as each node finishes"""
+        from metrics import span
+        from resilience import submission_budget
+
+        token = _active_runtime.set(self)
+        submission = _active_submission.set(self.risk_client.new_submission())
+        try:
+            with span("submission", property_id=inputs.get("property_id")), submission_budget(Config.LATENCY_BUDGET):
+                if on_node is None:
+                    return self.app.invoke({"inputs": inputs}, config=RUN_CONFIG)
+                state = None
+                for mode, chunk in self.app.stream({"inputs": inputs}, config=RUN_CONFIG,
+                                                   stream_mode=["updates", "values"]):
+                    if mode == "values":
+                        state = chunk
+                    else:
+                        for name, update in chunk.items():
+                            on_node(name, update)
+                return state
+        finally:
+            _active_submission.reset(submission)
+            _active_runtime.reset(token)
+
+    @property
+    def node_names(self) -> List[str]:
+        """Nodes a submission passes through, for progress reporting"""
+        return [name for name in self.app.nodes if not name.startswith("__")]
+
+    def _build_risk_client(self):
+        if Config.RISK_CLIENT == "mock":
+            return MockRiskAPIs(Config.SNOWFLAKE_CONFIG)
+        from api import RiskAPIs
+        from hazard_cache import HazardCache
+        from payload_store import default_store
+
+        # Raw provider payloads go to the store /payloads serves, results keep a raw_ref
+        options = {"submission_deadline": Config.LATENCY_BUDGET, "payload_store": default_store()}
+        if Config.HAZARD_CACHE:
+            options["cache"] = HazardCache(Config.HAZARD_CACHE)
+        if os.path.exists(Config.FIRE_STATION_INDEX):
+            from fire_stations import FireStationIndex
+            options["fire_station_index"] = FireStationIndex.load(Config.FIRE_STATION_INDEX)
+        if os.path.exists(Config.CLAIMS_INDEX):
+            from claims_index import ClaimsIndex
+            options["claims_index"] = ClaimsIndex.load(Config.CLAIMS_INDEX)
+            if Config.CLAIMS_REFRESH_INTERVAL > 0:
+                options["claims_index"].refresh_every(_connect_snowflake, Config.CLAIMS_REFRESH_INTERVAL)
+        return RiskAPIs(Config.SNOWFLAKE_CONFIG, **options)
+
+    def _build_retriever(self):
+        if Config.GUIDELINES_BACKEND == "faiss":
+            from rag_system import get_guideline_search
+            return get_guideline_search()
+        return setup_rag()
+
+    def _build_geocoder(self):
+        if not os.path.exists(Config.GEOCODER_INDEX):
+            logger.warning(f"No geocoder index at {Config.GEOCODER_INDEX}; every address uses fallback coordinates")
+            return False  # cached like a resource, so the check runs once
+        from geocoder import Geocoder
+        return Geocoder.load(Config.GEOCODER_INDEX)
+
+    def _resource(self, name: str, factory):
+        resource = self._resources.get(name)
+        if resource is None:
+            with self._lock:
+                resource = self._resources.get(name)
+                if resource is None:
+                    resource = self._resources[name] = factory()
+        return resource
+
+_default_runtime: Optional[InsurIQ] = None
+_default_runtime_lock = threading.Lock()
+
+def get_runtime() -> InsurIQ:
+    """The process-wide runtime, created on first call"""
+    global _default_runtime
+    if _default_runtime is None:
+        with _default_runtime_lock:
+            if _default_runtime is None:
+                _default_runtime = InsurIQ()
+    return _default_runtime
+
+def current_runtime() -> InsurIQ:
+    """Runtime driving the current invocation, falling back to the process-wide one"""
+    return _active_runtime.get() or get_runtime()
+
+def current_submission():
+    """Provider context (api.SubmissionContext) of the current invocation, if the risk client uses one"""
+    return _active_submission.get()
+
+def __getattr__(name):
+    # Lazy module attributes kept for callers of the former module-level globals
+    if name == "app":
+        return get_runtime().app
+    if name == "risk_client":
+        return get_runtime().risk_client
+    if name == "guidelines_retriever":
+        return get_runtime().retriever
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Streamlit UI
 def main():
-    st.title("InsurIQ - AI-Powered Underwriting")
-
-    with st.form("underwriting_form"):
-        st.subheader("Property Information")
-        col1, col2 = st.columns(2)
-        with col1:
-            property_id = st.text_input("Property ID", "PROP-123")
-            property_type = st.selectbox("Property Type", ["Residential", "Commercial", "Industrial"])
-            address = st.text_area("Address", "123 Main St, Los Angeles, CA")
-        with col2:
-            construction_type = st.selectbox("Construction Type", ["Wood", "Concrete", "Steel"])
-            year_built = st.number_input("Year Built", min_value=1800, max_value=2025, value=1990)
-            floors = st.number_input("Number of Floors", min_value=1, max_value=100, value=2)
-
-        submitted = st.form_submit_button("Submit for Underwriting")
-
-    if submitted:
-        inputs = {
-            "property_id": property_id,
-            "property_type": property_type,
-            "address": address,
-            "construction_type": construction_type,
-            "year_built": year_built,
-            "floors": floors
-        }
-
-        with st.spinner("Processing underwriting request..."):
-            result = app.invoke({"inputs": inputs})
-
-            st.success("Underwriting Complete!")
-
-            st.subheader("Risk Assessment")
-            risk_df = pd.DataFrame.from_dict(result["risk_scores"], orient="index", columns=["Score"])
-            st.bar_chart(risk_df)
-
-            st.metric("NATCAT Score", f"{result['natcat_score']:.1f}/100",
-                      delta_color="inverse" if result['natcat_score'] > 50 else "normal")
-
-            st.subheader("Underwriting Decision")
-            if result["decision"]["status"] == "STP":
-                st.success("✅ Straight Through Processing (STP) Eligible")
-            else:
-                st.warning("⚠️ Requires Manual Underwriting Review")
-
-            with st.expander("View Detailed Report"):
-                st.write(result["report"])
+    """Streamlit entry point (streamlit run main.py); the UI lives in insur_iq_app"""
+    from insur_iq_app import render
+
+    render()
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
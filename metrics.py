@@ -0,0 +1,266 @@
+"""
+In-process metrics and trace spans for the underwriting workflow.
+
+Workflow nodes (through main.build_workflow's node_hook) and provider calls in
+api.py record latency histograms, call and error counts, cache hits and payload
+sizes into REGISTRY, which renders the Prometheus text exposition format. The
+service exposes it at /metrics; other processes can call start_http_server().
+
+Tracing is off unless INSURIQ_TRACE=1 or enable_tracing() is called. Spans are
+collected per submission and handed to the trace sink (JSON log lines by
+default) when the submission's root span ends.
+"""
+import bisect
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+trace_logger = logging.getLogger("insuriq.trace")
+
+LATENCY_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}  # name -> (type, help)
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._buckets: Dict[str, Tuple[float, ...]] = {}
+
+    def counter(self, name: str, help_text: str):
+        self._help[name] = ("counter", help_text)
+        self._counters.setdefault(name, {})
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self._help[name] = ("histogram", help_text)
+        self._histograms.setdefault(name, {})
+        self._buckets[name] = buckets
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters[name]
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms[name]
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram(self._buckets[name])
+            histogram.observe(value)
+
+    def value(self, name: str, **labels) -> float:
+        """Current value of a counter series (0 when never incremented)"""
+        with self._lock:
+            return self._counters[name].get(tuple(sorted(labels.items())), 0)
+
+    def cache_hit_ratio(self) -> Dict[str, float]:
+        """Hit ratio per provider from insuriq_cache_requests_total"""
+        totals: Dict[str, List[float]] = {}
+        with self._lock:
+            for labels, count in self._counters.get("insuriq_cache_requests_total", {}).items():
+                labels = dict(labels)
+                hits_total = totals.setdefault(labels["provider"], [0, 0])
+                hits_total[0] += count if labels["result"] == "hit" else 0
+                hits_total[1] += count
+        return {provider: hits / total for provider, (hits, total) in totals.items() if total}
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in sorted(self._help.items()):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                    continue
+                for labels, histogram in sorted(self._histograms[name].items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _format_value(bound)
+                        lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(histogram.sum)}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        ratios = self.cache_hit_ratio()
+        if ratios:
+            lines.append("# HELP insuriq_cache_hit_ratio Share of provider lookups served from the hazard cache")
+            lines.append("# TYPE insuriq_cache_hit_ratio gauge")
+            for provider, ratio in sorted(ratios.items()):
+                lines.append(f"insuriq_cache_hit_ratio{_format_labels((('provider', provider),))} {_format_value(ratio)}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+REGISTRY = MetricsRegistry()
+REGISTRY.histogram("insuriq_node_duration_seconds", "Workflow node wall time")
+REGISTRY.counter("insuriq_node_errors_total", "Workflow node executions that raised")
+REGISTRY.histogram("insuriq_provider_request_duration_seconds", "Provider call latency, cache hits excluded")
+REGISTRY.counter("insuriq_provider_requests_total", "Provider calls by outcome (ok, error, timeout, circuit_open)")
+REGISTRY.histogram("insuriq_provider_payload_bytes", "Provider response body size", SIZE_BUCKETS)
+REGISTRY.counter("insuriq_cache_requests_total", "Hazard cache lookups by result (hit, miss)")
+
+# ------------------------------
+# Trace spans
+# ------------------------------
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "duration", "error")
+
+    def __init__(self, trace_id: str, parent_id: Optional[str], name: str, attributes: Dict):
+        self.trace_id = trace_id
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = attributes
+        self.start = time.time()
+        self.duration: Optional[float] = None
+        self.error: Optional[str] = None
+
+    def as_dict(self) -> Dict:
+        return {"trace_id": self.trace_id, "span_id": self.span_id, "parent_id": self.parent_id,
+                "name": self.name, "start": self.start, "duration_ms": round((self.duration or 0) * 1000, 3),
+                "error": self.error, **self.attributes}
+
+def _log_trace(spans: List[Span]):
+    for span in spans:
+        trace_logger.info(json.dumps(span.as_dict(), default=str))
+
+_tracing = {"enabled": os.getenv("INSURIQ_TRACE", "0") == "1", "sink": _log_trace}
+# (finished spans of the current trace, current span)
+_current: ContextVar[Optional[Tuple[List[Span], Span]]] = ContextVar("insuriq_span", default=None)
+
+def enable_tracing(sink: Optional[Callable[[List[Span]], None]] = None):
+    """Start collecting spans; sink receives every finished trace (defaults to JSON log lines)"""
+    _tracing["enabled"] = True
+    if sink is not None:
+        _tracing["sink"] = sink
+
+def disable_tracing():
+    _tracing["enabled"] = False
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Time a unit of work as a child of the current span. Outside a trace this starts
+    a new root span, whose trace is emitted when it ends. A no-op while tracing is off.
+    """
+    if not _tracing["enabled"]:
+        yield None
+        return
+    current = _current.get()
+    if current is None:
+        finished, parent = [], None
+        current_span = Span(uuid.uuid4().hex, None, name, attributes)
+    else:
+        finished, parent = current
+        current_span = Span(parent.trace_id, parent.span_id, name, attributes)
+    token = _current.set((finished, current_span))
+    started = time.perf_counter()
+    try:
+        yield current_span
+    except BaseException as e:
+        current_span.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        current_span.duration = time.perf_counter() - started
+        _current.reset(token)
+        finished.append(current_span)
+        if parent is None:
+            try:
+                _tracing["sink"](finished)
+            except Exception as e:
+                logger.warning(f"Trace sink failed: {e}")
+
+# ------------------------------
+# Instrumentation helpers
+# ------------------------------
+
+def instrument_node(name: str, node: Callable) -> Callable:
+    """main.build_workflow node_hook: latency, errors and a span for every node execution"""
+    @functools.wraps(node)
+    def instrumented(state):
+        started = time.perf_counter()
+        try:
+            with span(f"node {name}", node=name):
+                return node(state)
+        except Exception:
+            REGISTRY.inc("insuriq_node_errors_total", node=name)
+            raise
+        finally:
+            REGISTRY.observe("insuriq_node_duration_seconds", time.perf_counter() - started, node=name)
+    return instrumented
+
+def record_provider_call(provider: str, seconds: float, outcome: str, payload_bytes: Optional[int] = None):
+    REGISTRY.observe("insuriq_provider_request_duration_seconds", seconds, provider=provider)
+    REGISTRY.inc("insuriq_provider_requests_total", provider=provider, outcome=outcome)
+    if payload_bytes is not None:
+        REGISTRY.observe("insuriq_provider_payload_bytes", payload_bytes, provider=provider)
+
+def record_cache_lookup(provider: str, hit: bool):
+    REGISTRY.inc("insuriq_cache_requests_total", provider=provider, result="hit" if hit else "miss")
+
+def start_http_server(port: int = 9464, addr: str = "0.0.0.0") -> threading.Thread:
+    """Serve REGISTRY at http://addr:port/metrics from a daemon thread"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    thread = threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True)
+    thread.start()
+    logger.info(f"Serving metrics on {addr}:{port}/metrics")
+    return thread
@@ -0,0 +1,214 @@
+"""
+Content-addressed store for raw provider payloads.
+
+Payloads are serialized as canonical JSON, hashed with SHA-256 and written once
+as a zlib-compressed file named by the digest, so identical responses for
+neighbouring properties share one file. Results and workflow state carry only
+the reference ("sha256:<hex>").
+
+view() maps a stored blob without copying it, for audit export or serving as
+an HTTP body with Content-Encoding: deflate; get() inflates it straight from
+that mapping. Blobs untouched for max_age seconds, then the least recently
+used ones beyond max_bytes, are evicted by prune(), which put() starts on a
+background thread periodically.
+
+    python payload_store.py stats
+    python payload_store.py prune --max-mb 512 --max-days 30
+    python payload_store.py cat sha256:3f2a...
+"""
+import argparse
+import hashlib
+import json
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import time
+import zlib
+from typing import Any, Iterator, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DAY = 24 * 60 * 60
+DEFAULT_ROOT = os.getenv("INSURIQ_PAYLOAD_STORE", "payloads")
+DEFAULT_MAX_BYTES = int(float(os.getenv("INSURIQ_PAYLOAD_STORE_MAX_MB", "1024")) * 2 ** 20)
+DEFAULT_MAX_AGE = float(os.getenv("INSURIQ_PAYLOAD_RETENTION_DAYS", "30")) * DAY
+PRUNE_EVERY = 1000  # puts between automatic prune() runs
+REF_PREFIX = "sha256:"
+
+def canonical_json(payload: Any) -> bytes:
+    """Key-sorted compact JSON, so equal payloads hash equally whatever their key order"""
+    return json.dumps(payload, sort_keys=True, separators=(",", ":"), default=str).encode()
+
+class PayloadStore:
+    """Deduplicated, compressed payload files under root/<2 hex>/<digest>.z"""
+
+    def __init__(self, root: str = DEFAULT_ROOT, max_bytes: int = DEFAULT_MAX_BYTES,
+                 max_age: float = DEFAULT_MAX_AGE, level: int = 6):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.level = level
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._pruning = False
+        self.stats = {"writes": 0, "deduplicated": 0, "bytes_in": 0, "bytes_stored": 0, "evicted": 0}
+
+    def path(self, ref: str) -> str:
+        digest = ref[len(REF_PREFIX):] if ref.startswith(REF_PREFIX) else ref
+        if len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+            raise ValueError(f"Not a payload reference: {ref!r}")
+        return os.path.join(self.root, digest[:2], f"{digest}.z")
+
+    def put(self, payload: Any) -> str:
+        """Store payload (once per distinct content) and return its reference"""
+        data = canonical_json(payload)
+        ref = REF_PREFIX + hashlib.sha256(data).hexdigest()
+        path = self.path(ref)
+        if os.path.exists(path):
+            self._touch(path)
+            with self._lock:
+                self.stats["deduplicated"] += 1
+        else:
+            compressed = zlib.compress(data, self.level)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write then rename, so a reader never sees a partial blob
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(compressed)
+            os.replace(tmp, path)
+            with self._lock:
+                self.stats["writes"] += 1
+                self.stats["bytes_in"] += len(data)
+                self.stats["bytes_stored"] += len(compressed)
+        with self._lock:
+            self._puts += 1
+            prune = self._puts % PRUNE_EVERY == 0 and not self._pruning
+            if prune:
+                self._pruning = True
+        if prune:
+            # A prune scans every blob; callers (the provider client) must not wait on it
+            threading.Thread(target=self._background_prune, name="payload-prune", daemon=True).start()
+        return ref
+
+    def view(self, ref: str) -> Optional[memoryview]:
+        """Compressed blob as a read-only memory map (no copy), or None once evicted"""
+        try:
+            with open(self.path(ref), "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (FileNotFoundError, ValueError):
+            return None
+        return memoryview(mapped)
+
+    def get(self, ref: str) -> Optional[Any]:
+        """Decoded payload, or None when it was evicted"""
+        blob = self.view(ref)
+        if blob is None:
+            return None
+        try:
+            payload = json.loads(zlib.decompress(blob))
+        finally:
+            blob.release()
+        self._touch(self.path(ref))
+        return payload
+
+    def __contains__(self, ref: str) -> bool:
+        return os.path.exists(self.path(ref))
+
+    def usage(self) -> Tuple[int, int]:
+        """(blobs, bytes) currently stored"""
+        blobs = total = 0
+        for _, size, _ in self._blobs():
+            blobs += 1
+            total += size
+        return blobs, total
+
+    def prune(self, max_bytes: Optional[int] = None, max_age: Optional[float] = None) -> int:
+        """Evict blobs idle longer than max_age, then least recently used ones until under max_bytes"""
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        max_age = self.max_age if max_age is None else max_age
+        now = time.time()
+        blobs = sorted(self._blobs(), key=lambda blob: blob[2])  # oldest access first
+        total = sum(size for _, size, _ in blobs)
+        evicted = 0
+        for path, size, accessed in blobs:
+            if now - accessed <= max_age and total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            evicted += 1
+        if evicted:
+            logger.info(f"Evicted {evicted} payloads, {total / 2 ** 20:.1f} MB remain")
+            with self._lock:
+                self.stats["evicted"] += evicted
+        return evicted
+
+    def _background_prune(self):
+        try:
+            self.prune()
+        except Exception as e:
+            logger.error(f"Payload store prune failed: {e}")
+        finally:
+            with self._lock:
+                self._pruning = False
+
+    def _blobs(self) -> Iterator[Tuple[str, int, float]]:
+        """(path, size, last access) of every stored blob"""
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(".z"):
+                    st = entry.stat()
+                    yield entry.path, st.st_size, st.st_mtime
+
+    def _touch(self, path: str):
+        # mtime doubles as the last-access time retention works from
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+
+_default_store: Optional[PayloadStore] = None
+_default_store_lock = threading.Lock()
+
+def default_store() -> PayloadStore:
+    """The process-wide store under INSURIQ_PAYLOAD_STORE, created on first call"""
+    global _default_store
+    if _default_store is None:
+        with _default_store_lock:
+            if _default_store is None:
+                _default_store = PayloadStore()
+    return _default_store
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect and prune the raw payload store")
+    parser.add_argument("command", choices=["stats", "prune", "cat"])
+    parser.add_argument("ref", nargs="?", help="payload reference for cat")
+    parser.add_argument("--root", default=DEFAULT_ROOT)
+    parser.add_argument("--max-mb", type=float, help="size limit for prune")
+    parser.add_argument("--max-days", type=float, help="retention limit for prune")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    store = PayloadStore(args.root)
+    if args.command == "stats":
+        blobs, total = store.usage()
+        print(f"{blobs} payloads, {total / 2 ** 20:.1f} MB in {args.root}")
+    elif args.command == "prune":
+        max_bytes = int(args.max_mb * 2 ** 20) if args.max_mb is not None else None
+        max_age = args.max_days * DAY if args.max_days is not None else None
+        print(f"evicted {store.prune(max_bytes, max_age)} payloads")
+    else:
+        payload = store.get(args.ref)
+        if payload is None:
+            parser.exit(1, f"{args.ref} is not in {args.root}\n")
+        print(json.dumps(payload, indent=2))
+
+if __name__ == "__main__":
+    main()
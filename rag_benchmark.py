@@ -0,0 +1,107 @@
+"""
+Recall / latency / memory benchmark for the guideline index modes.
+
+Builds a synthetic clustered corpus shaped like the guideline embeddings, trains
+every index mode from rag_system.INDEX_MODES on it, and reports recall@k against
+the exact flat search, p50/p99 single-query latency and serialized index size.
+Use it to choose INSURIQ_INDEX_MODE and INSURIQ_NPROBE before the corpus grows:
+
+    python rag_benchmark.py --vectors 200000 --nprobe 8 16 32 --json bench.json
+"""
+import argparse
+import json
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from rag_system import INDEX_MODES, compress_index, index_description, set_nprobe
+
+def synthetic_corpus(n: int, dim: int, clusters: int = 256, seed: int = 0) -> np.ndarray:
+    """Unit-norm vectors drawn around random topic centres, like sentence embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centres[rng.integers(0, clusters, n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def synthetic_queries(corpus: np.ndarray, n: int, seed: int = 1) -> np.ndarray:
+    """Perturbed corpus vectors, so every query has close neighbours"""
+    rng = np.random.default_rng(seed)
+    queries = corpus[rng.integers(0, len(corpus), n)] + 0.3 * rng.standard_normal((n, corpus.shape[1])).astype(np.float32)
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+def index_bytes(index) -> int:
+    import faiss
+    return int(faiss.serialize_index(index).nbytes)
+
+def measure(index, queries: np.ndarray, k: int, truth: Optional[np.ndarray]) -> Dict:
+    """Single-query latency percentiles and recall@k against truth (exact neighbours)"""
+    import faiss
+
+    threads = faiss.omp_get_max_threads()
+    faiss.omp_set_num_threads(1)  # per-query latency as a single request sees it
+    latencies = np.empty(len(queries))
+    found = np.empty((len(queries), k), dtype=np.int64)
+    for i, query in enumerate(queries):
+        started = time.perf_counter()
+        _, ids = index.search(query[None, :], k)
+        latencies[i] = time.perf_counter() - started
+        found[i] = ids[0]
+    faiss.omp_set_num_threads(threads)
+    recall = 1.0 if truth is None else float(np.mean([
+        len(np.intersect1d(f, t)) / k for f, t in zip(found, truth)
+    ]))
+    return {
+        "recall_at_k": round(recall, 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 3),
+        "index_mb": round(index_bytes(index) / 2 ** 20, 2),
+    }
+
+def run(vectors: int = 100_000, dim: int = 384, queries: int = 500, k: int = 4,
+        modes: Optional[List[str]] = None, nprobes: Optional[List[int]] = None) -> List[Dict]:
+    """One result row per (mode, nprobe); the flat row is the exact baseline"""
+    import faiss
+
+    corpus = synthetic_corpus(vectors, dim)
+    probe = synthetic_queries(corpus, queries)
+    flat = faiss.IndexFlatL2(dim)
+    flat.add(corpus)
+    _, truth = flat.search(probe, k)
+
+    rows = [{"mode": "flat", "description": "Flat", "nprobe": None, "train_s": 0.0, **measure(flat, probe, k, None)}]
+    for mode in modes or [m for m in INDEX_MODES if m != "flat"]:
+        description = index_description(mode, vectors, dim)
+        if description is None:
+            print(f"skip {mode}: flat at {vectors} vectors")
+            continue
+        started = time.perf_counter()
+        index = compress_index(flat, description=description)
+        train_s = round(time.perf_counter() - started, 2)
+        for nprobe in nprobes or [16]:
+            set_nprobe(index, nprobe)
+            rows.append({"mode": mode, "description": description, "nprobe": nprobe,
+                         "train_s": train_s, **measure(index, probe, k, truth)})
+    return rows
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--vectors", type=int, default=100_000)
+    parser.add_argument("--dim", type=int, default=384, help="all-MiniLM-L6-v2 embeds to 384 dimensions")
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("-k", type=int, default=4)
+    parser.add_argument("--modes", nargs="+", choices=[m for m in INDEX_MODES if m != "flat"])
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[4, 16, 64])
+    parser.add_argument("--json", help="also write the rows to this file")
+    args = parser.parse_args()
+
+    rows = run(args.vectors, args.dim, args.queries, args.k, args.modes, args.nprobe)
+    print(f"{'mode':<8} {'index':<18} {'nprobe':>6} {'recall@' + str(args.k):>9} "
+          f"{'p50 ms':>8} {'p99 ms':>8} {'MB':>8} {'train s':>8}")
+    for row in rows:
+        print(f"{row['mode']:<8} {row['description']:<18} {row['nprobe'] or '-':>6} {row['recall_at_k']:>9.3f} "
+              f"{row['p50_ms']:>8.3f} {row['p99_ms']:>8.3f} {row['index_mb']:>8.2f} {row['train_s']:>8.2f}")
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(rows, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,602 @@
-from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import DirectoryLoader
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import HuggingFaceEmbeddings
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import pickle
+import queue
+import shutil
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional, Tuple
+
+# FAISS, LangChain and the embedding model are imported on first use so that
+# importing this module costs nothing until a guideline lookup needs them
+if TYPE_CHECKING:
+    from langchain_community.vectorstores import FAISS
+
+logger = logging.getLogger(__name__)
+
+GUIDELINES_DIR = "underwriting_guidelines/"
+INDEX_DIR = "guidelines_index/"
+EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+KEEP_VERSIONS = 2  # Older versions may still be mapped by running workers
+EMBED_BATCH_SIZE = 64
+STAGE_QUEUE_SIZE = 8  # Items buffered between pipeline stages
+
+# Search index mode; pick an operating point with rag_benchmark.py
+INDEX_MODE = os.getenv("INSURIQ_INDEX_MODE", "flat")
+NPROBE = int(os.getenv("INSURIQ_NPROBE", "16"))  # IVF lists scanned per query
+MIN_COMPRESS_VECTORS = 4096  # Below this a flat scan is exact and already fast
+TRAIN_SAMPLE = 65536  # Vectors used to train IVF centroids / quantizers; bounds rebuild time
+
+# faiss.index_factory descriptions; nlist and m are derived from corpus size and dimension
+INDEX_MODES = {
+    "flat": None,
+    "ivf": "IVF{nlist},Flat",
+    "ivf-sq8": "IVF{nlist},SQ8",
+    "ivf-pq": "IVF{nlist},PQ{m}x8",
+}
+
+# On-disk layout shared by every worker:
+#   INDEX_DIR/CURRENT          name of the live version directory (swapped atomically)
+#   INDEX_DIR/v<ts>/index.faiss exact flat vectors, the source for incremental rebuilds
+#   INDEX_DIR/v<ts>/search.faiss IVF / compressed copy served instead, when INDEX_MODE asks for one
+#   INDEX_DIR/v<ts>/index.pkl   docstore and id mapping (unpickled into every process that loads it)
+#   INDEX_DIR/v<ts>/manifest.json per-file size, mtime, content hash and chunk ids
+#                                ("<relative path>@<hash prefix>:<n>")
+
+@lru_cache(maxsize=1)
+def get_embeddings():
+    from langchain_community.embeddings import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _current_version(index_dir: str) -> Optional[str]:
+    try:
+        with open(os.path.join(index_dir, "CURRENT")) as f:
+            return os.path.join(index_dir, f.read().strip())
+    except FileNotFoundError:
+        return None
+
+def _load_manifest(version_dir: Optional[str]) -> Dict:
+    if version_dir is None:
+        return {"files": {}}
+    with open(os.path.join(version_dir, "manifest.json")) as f:
+        return json.load(f)
+
+def _scan(guidelines_dir: str, known: Dict) -> Dict[str, Dict]:
+    """Size, mtime and content hash of every PDF; files whose size and mtime are unchanged are not re-hashed"""
+    files = {}
+    for root, _, names in os.walk(guidelines_dir):
+        for name in names:
+            if not name.lower().endswith(".pdf"):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, guidelines_dir)
+            stat = os.stat(path)
+            previous = known.get(rel)
+            if previous and previous["size"] == stat.st_size and previous["mtime"] == stat.st_mtime:
+                files[rel] = previous
+            else:
+                files[rel] = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": _file_hash(path)}
+    return files
+
+def index_is_current(guidelines_dir: str = GUIDELINES_DIR, index_dir: str = INDEX_DIR,
+                     mode: str = INDEX_MODE) -> bool:
+    """True when the saved index already reflects every guideline document in the requested mode"""
+    version_dir = _current_version(index_dir)
+    if version_dir is None:
+        return False
+    manifest = _load_manifest(version_dir)
+    if manifest.get("mode", "flat") != mode:
+        return False
+    known = manifest["files"]
+    scanned = _scan(guidelines_dir, known)
+    return {rel: f["hash"] for rel, f in scanned.items()} == {rel: f["hash"] for rel, f in known.items()}
+
+def index_description(mode: str, n: int, dim: int) -> Optional[str]:
+    """faiss.index_factory description for mode at this corpus size, or None for a flat index"""
+    if mode not in INDEX_MODES:
+        raise ValueError(f"Unknown index mode {mode!r}; expected one of {', '.join(INDEX_MODES)}")
+    template = INDEX_MODES[mode]
+    if template is None or n < MIN_COMPRESS_VECTORS:
+        return None
+    nlist = max(16, min(int(4 * n ** 0.5), n // 39))  # faiss wants ~39+ training points per list
+    m = next(m for m in range(max(dim // 8, 1), 0, -1) if dim % m == 0)  # ~8 dims per PQ sub-quantizer
+    return template.format(nlist=nlist, m=m)
+
+def compress_index(flat, mode: str = INDEX_MODE, description: Optional[str] = None):
+    """
+    Train an IVF / quantized copy of a flat index, keeping vector positions (and so
+    docstore ids) unchanged. Returns None when mode is flat or the corpus is too small.
+    """
+    import faiss
+    import numpy as np
+
+    description = description or index_description(mode, flat.ntotal, flat.d)
+    if description is None:
+        return None
+    vectors = flat.reconstruct_n(0, flat.ntotal)
+    sample = vectors
+    if len(vectors) > TRAIN_SAMPLE:
+        sample = vectors[np.random.default_rng(0).choice(len(vectors), TRAIN_SAMPLE, replace=False)]
+    index = faiss.index_factory(flat.d, description, flat.metric_type)
+    index.train(sample)
+    index.add(vectors)
+    return index
+
+def set_nprobe(index, nprobe: int):
+    """Set how many IVF lists a search visits; a no-op for flat indexes"""
+    import faiss
+    try:
+        faiss.extract_index_ivf(index).nprobe = nprobe
+    except RuntimeError:
+        pass
+
+# ------------------------------
+# Streaming ingestion pipeline
+#   parse (process pool) -> chunk -> embed (fixed-size batches) -> insert
+# Stages run concurrently and are joined by bounded queues, so only a few files
+# and one embedding batch are ever held in memory.
+# ------------------------------
+
+_DONE = object()
+POLL_INTERVAL = 0.1  # seconds a blocked stage waits before re-checking for cancellation
+
+class _Cancelled(Exception):
+    """Raised inside a stage once another stage has failed"""
+
+class StageMetrics:
+    """Items handled and wall time (first start to finish) of one pipeline stage"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.items = 0
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    @property
+    def wall(self) -> float:
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_dict(self) -> Dict:
+        wall = self.wall
+        return {"items": self.items, "wall_s": round(wall, 3),
+                "items_per_s": round(self.items / wall, 1) if wall else None}
+
+def _parse_pdf(path: str) -> list:
+    """Runs in a worker process"""
+    from langchain_community.document_loaders import PyPDFLoader
+    return PyPDFLoader(path).load()
+
+def _put(outbox: queue.Queue, item, cancel: threading.Event):
+    """Block until outbox has room, giving up once the pipeline is cancelled"""
+    while True:
+        if cancel.is_set():
+            raise _Cancelled()
+        try:
+            outbox.put(item, timeout=POLL_INTERVAL)
+            return
+        except queue.Full:
+            pass
+
+def _drain(inbox: queue.Queue, cancel: threading.Event):
+    """Yield items until end-of-stream, stopping once the pipeline is cancelled"""
+    while True:
+        if cancel.is_set():
+            raise _Cancelled()
+        try:
+            item = inbox.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+        if item is _DONE:
+            return
+        yield item
+
+def _stage(target, inbox: Optional[queue.Queue], outbox: queue.Queue, cancel: threading.Event,
+           errors: List[BaseException], metrics: StageMetrics) -> threading.Thread:
+    """Run target(inbox, outbox) in a thread; a failure is recorded and cancels every other stage"""
+    def run():
+        metrics.started = time.perf_counter()
+        try:
+            target(inbox, outbox)
+            _put(outbox, _DONE, cancel)
+        except _Cancelled:
+            pass
+        except BaseException as e:
+            errors.append(e)
+            cancel.set()
+        finally:
+            metrics.finished = time.perf_counter()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+def ingest(files: Dict[str, str], id_prefixes: Dict[str, str], embeddings, vectorstore=None,
+           parse_workers: Optional[int] = None, batch_size: int = EMBED_BATCH_SIZE) -> Tuple:
+    """
+    Stream files (rel -> path) into vectorstore, creating one if needed.
+    Chunk ids are "<id prefix>:<n>" per file. Returns the vector store, the chunk
+    ids of each file and per-stage metrics. If any stage fails, the others are
+    cancelled, queued parses are dropped and the first error is raised.
+    """
+    from langchain_community.vectorstores import FAISS
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    metrics = {name: StageMetrics(name) for name in ("parse", "chunk", "embed", "insert")}
+    queues = parsed, chunked, embedded = [queue.Queue(maxsize=STAGE_QUEUE_SIZE) for _ in range(3)]
+    workers = parse_workers or min(os.cpu_count() or 1, max(len(files), 1))
+    cancel = threading.Event()
+    errors: List[BaseException] = []
+
+    def parse(_, outbox):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            pending = {}
+            items = iter(files.items())
+            try:
+                while True:
+                    # Keep at most 2 x workers files in flight
+                    for rel, path in items:
+                        pending[pool.submit(_parse_pdf, path)] = rel
+                        if len(pending) >= workers * 2:
+                            break
+                    if not pending:
+                        return
+                    done, _ = wait(pending, timeout=POLL_INTERVAL, return_when=FIRST_COMPLETED)
+                    if cancel.is_set():
+                        raise _Cancelled()
+                    for future in done:
+                        rel = pending.pop(future)
+                        docs = future.result()
+                        metrics["parse"].items += 1
+                        _put(outbox, (rel, docs), cancel)
+            except BaseException:
+                # Only parses already running are waited for when the pool exits
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+
+    def chunk(inbox, outbox):
+        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+        for rel, docs in _drain(inbox, cancel):
+            for n, split in enumerate(text_splitter.split_documents(docs)):
+                metrics["chunk"].items += 1
+                _put(outbox, (rel, f"{id_prefixes[rel]}:{n}", split), cancel)
+
+    def embed(inbox, outbox):
+        batch = []
+        for item in _drain(inbox, cancel):
+            batch.append(item)
+            if len(batch) == batch_size:
+                _put(outbox, embed_batch(batch), cancel)
+                batch = []
+        if batch:
+            _put(outbox, embed_batch(batch), cancel)
+
+    def embed_batch(batch):
+        vectors = embeddings.embed_documents([split.page_content for _, _, split in batch])
+        metrics["embed"].items += len(batch)
+        return batch, vectors
+
+    threads = [
+        _stage(parse, None, parsed, cancel, errors, metrics["parse"]),
+        _stage(chunk, parsed, chunked, cancel, errors, metrics["chunk"]),
+        _stage(embed, chunked, embedded, cancel, errors, metrics["embed"]),
+    ]
+
+    file_ids = {rel: [] for rel in files}
+    metrics["insert"].started = time.perf_counter()
+    completed = False
+    try:
+        for batch, vectors in _drain(embedded, cancel):
+            ids = [chunk_id for _, chunk_id, _ in batch]
+            text_embeddings = [(split.page_content, vector) for (_, _, split), vector in zip(batch, vectors)]
+            metadatas = [split.metadata for _, _, split in batch]
+            if vectorstore is None:
+                vectorstore = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+            else:
+                vectorstore.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+            for rel, chunk_id, _ in batch:
+                file_ids[rel].append(chunk_id)
+            metrics["insert"].items += len(batch)
+        completed = True
+    except _Cancelled:
+        raise errors[0]
+    finally:
+        metrics["insert"].finished = time.perf_counter()
+        # On failure: stop every stage, empty the queues so nothing stays blocked, and wait for
+        # the threads (the parse stage only returns once its worker processes have exited)
+        if not completed:
+            cancel.set()
+            for q in queues:
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+        for thread in threads:
+            thread.join()
+
+    report = {name: m.as_dict() for name, m in metrics.items()}
+    logger.info(f"Ingested {len(files)} documents: {report}")
+    return vectorstore, file_ids, report
+
+def build_index(guidelines_dir: str = GUIDELINES_DIR, index_dir: str = INDEX_DIR,
+                mode: str = INDEX_MODE) -> Dict:
+    """
+    Bring the on-disk index up to date with guidelines_dir.
+    Only documents whose content hash changed are re-embedded; chunks of deleted
+    documents are dropped. The flat index is always kept for the next incremental
+    build; non-flat modes are retrained from it on every new version. Returns
+    counts of added, removed and unchanged files.
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # one builder at a time across workers
+
+        version_dir = _current_version(index_dir)
+        manifest = _load_manifest(version_dir)
+        known = manifest["files"]
+        scanned = _scan(guidelines_dir, known)
+
+        stale = [rel for rel, f in known.items() if rel not in scanned or scanned[rel]["hash"] != f["hash"]]
+        fresh = [rel for rel, f in scanned.items() if rel not in known or known[rel]["hash"] != f["hash"]]
+        stats = {"added": len(fresh), "removed": len(stale), "unchanged": len(scanned) - len(fresh)}
+        if not stale and not fresh and version_dir is not None and manifest.get("mode", "flat") == mode:
+            return stats
+
+        embeddings = get_embeddings()
+        vectorstore = None
+        if version_dir is not None:
+            vectorstore = FAISS.load_local(version_dir, embeddings, allow_dangerous_deserialization=True)
+            stale_ids = [i for rel in stale for i in known[rel]["ids"]]
+            if stale_ids:
+                vectorstore.delete(stale_ids)
+
+        if fresh:
+            vectorstore, file_ids, stats["pipeline"] = ingest(
+                {rel: os.path.join(guidelines_dir, rel) for rel in fresh},
+                # Path plus content hash: two files with identical content must not share chunk ids
+                {rel: f"{rel}@{scanned[rel]['hash'][:16]}" for rel in fresh},
+                embeddings, vectorstore
+            )
+            for rel in fresh:
+                scanned[rel]["ids"] = file_ids[rel]
+        for rel in scanned:
+            scanned[rel].setdefault("ids", known.get(rel, {}).get("ids", []))
+
+        if vectorstore is None:
+            # Empty corpus: keep an empty flat index so readers still have something to load
+            dim = len(embeddings.embed_query("underwriting"))
+            vectorstore = FAISS(embeddings, faiss.IndexFlatL2(dim), InMemoryDocstore(), {})
+
+        # Write a new version next to the live one, then swap CURRENT atomically
+        name = f"v{time.time_ns()}"
+        new_dir = os.path.join(index_dir, name)
+        vectorstore.save_local(new_dir)
+        description = index_description(mode, vectorstore.index.ntotal, vectorstore.index.d)
+        if description is not None:
+            started = time.perf_counter()
+            faiss.write_index(compress_index(vectorstore.index, description=description),
+                              os.path.join(new_dir, "search.faiss"))
+            stats["search_index"] = description
+            logger.info(f"Trained {description} over {vectorstore.index.ntotal} vectors "
+                        f"in {time.perf_counter() - started:.1f}s")
+        with open(os.path.join(new_dir, "manifest.json"), "w") as f:
+            json.dump({"files": scanned, "version": name, "mode": mode, "search_index": description}, f)
+        pointer = os.path.join(index_dir, "CURRENT.tmp")
+        with open(pointer, "w") as f:
+            f.write(name)
+        os.replace(pointer, os.path.join(index_dir, "CURRENT"))
+
+        versions = sorted(d for d in os.listdir(index_dir) if d.startswith("v"))
+        for old in versions[:-KEEP_VERSIONS]:
+            shutil.rmtree(os.path.join(index_dir, old), ignore_errors=True)
+
+        logger.info(f"Guideline index {name}: {stats}")
+        return stats
+
+def load_index(index_dir: str = INDEX_DIR, version_dir: Optional[str] = None,
+               nprobe: int = NPROBE) -> "FAISS":
+    """
+    Load an index version (the live one by default) for searching; the compressed
+    search index is preferred when the version has one. Vectors are memory-mapped
+    read-only, so workers share them through the page cache: a flat index needs
+    IO_FLAG_MMAP_IFC, as IO_FLAG_MMAP still copies its vector array into memory.
+    The docstore (chunk text and metadata) is not shared; each process holds its
+    own unpickled copy, which grows with the corpus.
+    """
+    import faiss
+    from langchain_community.vectorstores import FAISS
+
+    version_dir = version_dir or _current_version(index_dir)
+    if version_dir is None:
+        raise FileNotFoundError(f"No guideline index in {index_dir}; run build_index() first")
+    path = os.path.join(version_dir, "search.faiss")
+    mmap = faiss.IO_FLAG_MMAP  # IVF lists
+    if not os.path.exists(path):
+        path = os.path.join(version_dir, "index.faiss")
+        mmap = faiss.IO_FLAG_MMAP_IFC  # flat codes
+    index = faiss.read_index(path, mmap | faiss.IO_FLAG_READ_ONLY)
+    set_nprobe(index, nprobe)
+    with open(os.path.join(version_dir, "index.pkl"), "rb") as f:
+        docstore, index_to_docstore_id = pickle.load(f)
+    return FAISS(get_embeddings(), index, docstore, index_to_docstore_id)
 
 # Prepare RAG system for underwriting guidelines
 def setup_rag():
-    # Load underwriting guidelines documents
-    loader = DirectoryLoader('underwriting_guidelines/', glob="**/*.pdf")
-    docs = loader.load()
+    if not index_is_current():
+        build_index()
+    return load_index().as_retriever()
 
-    # Split documents
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-    splits = text_splitter.split_documents(docs)
+@lru_cache(maxsize=1)
+def get_retriever():
+    """The guidelines retriever, set up on first use and cached per process"""
+    return setup_rag()
 
-    # Create vector store
-    embeddings = HuggingFaceEmbeddings(model_name="all-MiniLM-L6-v2")
-    vectorstore = FAISS.from_documents(splits, embeddings)
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
 
-    return vectorstore.as_retriever()
+def embed_queries(embedder, queries: List[str]) -> List[list]:
+    """
+    Query embeddings for several queries. HuggingFaceEmbeddings encodes queries
+    exactly like documents, so they go through embed_documents as one batch;
+    other models may encode queries differently and get embed_query each.
+    """
+    from langchain_community.embeddings import HuggingFaceEmbeddings
 
-# Use in agents
-guidelines_retriever = setup_rag()
+    if type(embedder) is HuggingFaceEmbeddings:
+        return embedder.embed_documents(queries)
+    return [embedder.embed_query(query) for query in queries]
 
+class GuidelineSearch:
+    """
+    Guideline retrieval with a result cache and a query-embedding cache.
+
+    Results are keyed by (index version, normalized query), so they are dropped
+    automatically once a rebuild swaps in a new version. Embeddings depend only on
+    the query and the model, so they survive rebuilds. Queries get query
+    embeddings (see embed_queries), as with the vector store's own retriever, so
+    asymmetric models (separate query and document encodings) rank the same either way.
+    """
+
+    def __init__(self, index_dir: str = INDEX_DIR, k: int = 4, max_entries: int = 1024,
+                 version_check_interval: float = 5.0):
+        self.index_dir = index_dir
+        self.k = k
+        self.max_entries = max_entries
+        self.version_check_interval = version_check_interval
+        self.stats = {"hits": 0, "misses": 0, "embedded": 0, "reloads": 0}
+        self._results: "OrderedDict[tuple, list]" = OrderedDict()
+        self._embeddings: "OrderedDict[str, list]" = OrderedDict()
+        self._vectorstore = None
+        self._version: Optional[str] = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()  # caches and the loaded version only; never held while embedding
+        self._reload_lock = threading.Lock()
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._version
+
+    def search(self, query: str) -> list:
+        return self.search_many([query])[query]
+
+    def search_many(self, queries: Iterable[str]) -> Dict[str, list]:
+        """
+        Documents for every query; the uncached distinct queries are embedded in one
+        batch. The lock only guards the caches, so concurrent callers embed and
+        search in parallel.
+        """
+        queries = list(queries)
+        version, vectorstore = self._current()
+        keys = {query: normalize_query(query) for query in queries}
+        found: Dict[str, list] = {}
+        vectors: Dict[str, list] = {}
+        with self._lock:
+            for key in dict.fromkeys(keys.values()):
+                if (version, key) in self._results:
+                    self._results.move_to_end((version, key))
+                    found[key] = self._results[(version, key)]
+                elif key in self._embeddings:
+                    self._embeddings.move_to_end(key)
+                    vectors[key] = self._embeddings[key]
+            misses = [key for key in dict.fromkeys(keys.values()) if key not in found]
+            self.stats["hits"] += len(queries) - len(misses)
+            self.stats["misses"] += len(misses)
+
+        to_embed = [key for key in misses if key not in vectors]
+        if to_embed:
+            vectors.update(zip(to_embed, embed_queries(vectorstore.embedding_function, to_embed)))
+        for key in misses:
+            found[key] = vectorstore.similarity_search_by_vector(vectors[key], k=self.k)
+
+        with self._lock:
+            self.stats["embedded"] += len(to_embed)
+            for key in to_embed:
+                self._remember(self._embeddings, key, vectors[key])
+            if version == self._version:  # results of a version swapped out meanwhile are not kept
+                for key in misses:
+                    self._remember(self._results, (version, key), found[key])
+        return {query: found[key] for query, key in keys.items()}
+
+    def invoke(self, query: str) -> list:
+        """Retriever-compatible single lookup"""
+        return self.search(query)
+
+    def _current(self) -> Tuple[Optional[str], "FAISS"]:
+        """
+        The loaded (version, vector store), reloading it when a rebuild has swapped
+        CURRENT (checked at most every interval). Other callers keep searching the
+        loaded version while one thread reloads.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._vectorstore is not None and now - self._checked_at < self.version_check_interval:
+                return self._version, self._vectorstore
+            self._checked_at = now
+            loaded = self._version, self._vectorstore
+        version_dir = _current_version(self.index_dir)
+        if loaded[1] is not None and version_dir == loaded[0]:
+            return loaded
+        with self._reload_lock:
+            with self._lock:
+                if self._vectorstore is not None and self._version == version_dir:
+                    return self._version, self._vectorstore  # another caller reloaded it
+            vectorstore = load_index(self.index_dir, version_dir)
+            with self._lock:
+                self._vectorstore, self._version = vectorstore, version_dir
+                self._results.clear()
+                self.stats["reloads"] += 1
+            return version_dir, vectorstore
+
+    def _remember(self, cache: OrderedDict, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > self.max_entries:
+            cache.popitem(last=False)
+
+@lru_cache(maxsize=1)
+def get_guideline_search() -> GuidelineSearch:
+    """Process-wide cached guideline search; builds the index first if it is out of date"""
+    if not index_is_current():
+        build_index()
+    return GuidelineSearch()
+
+# Use in agents
 def get_relevant_guidelines(query):
-    docs = guidelines_retriever.get_relevant_documents(query)
-    return "\n\n".join(doc.page_content for doc in docs)
\ No newline at end of file
+    docs = get_guideline_search().search(query)
+    return "\n\n".join(doc.page_content for doc in docs)
+
+def get_guidelines_for(queries: List[str]) -> Dict[str, str]:
+    """Guideline text for several queries resolved in one batched lookup"""
+    return {
+        query: "\n\n".join(doc.page_content for doc in docs)
+        for query, docs in get_guideline_search().search_many(queries).items()
+    }
+
+def __getattr__(name):
+    # guidelines_retriever used to be built at import time
+    if name == "guidelines_retriever":
+        return get_retriever()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    print(build_index())
@@ -0,0 +1,207 @@
+"""
+Provider resilience: latency budgets, circuit breakers, hedged requests and
+degraded fallbacks.
+
+A submission gets one latency budget (set with submission_budget()); each
+provider call may use at most its share of it, and never more than what is left.
+Providers that keep failing are short-circuited by a CircuitBreaker until a
+probe succeeds. Slow tail requests are hedged: when the first attempt has not
+answered within the provider's recent p95 (or has failed), a second one is
+started and the first answer wins. A peril that still has no result falls back to the last good
+result for that location (stale cache) or to a regional default, with a lowered
+confidence so the degradation is visible downstream.
+"""
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Awaitable, Callable, Dict, Optional, Tuple
+
+# Share of the submission budget a single call to each provider may use. Providers
+# are called concurrently, so shares need not sum to 1.
+DEFAULT_BUDGET_SHARES = {
+    "hazardhub": 0.6,
+    "fema": 0.6,
+    "usgs": 0.4,
+    "attom": 0.4,
+    "overpass": 0.3,  # the local fire station index covers most lookups
+    "snowflake": 0.5,
+}
+
+# Confidence reported for degraded results
+STALE_CONFIDENCE_FACTOR = 0.6  # multiplies the confidence of the cached result
+REGIONAL_DEFAULT_CONFIDENCE = 0.3
+
+# Coarse (lat_min, lat_max, lon_min, lon_max) boxes and the typical 0-5 peril
+# score inside them; used only when neither a provider nor the cache can answer
+REGIONS = {
+    "west_coast": (32.0, 49.0, -125.0, -114.0),
+    "gulf_coast": (25.0, 31.5, -98.0, -80.0),
+    "atlantic_coast": (25.0, 45.0, -81.0, -66.0),
+}
+REGIONAL_DEFAULTS = {
+    "west_coast": {"fire": 3.5, "flood": 1.5, "windstorm": 1.0, "earthquake": 3.5, "construction": 2.5, "claims": 2.0},
+    "gulf_coast": {"fire": 1.5, "flood": 4.0, "windstorm": 4.0, "earthquake": 0.5, "construction": 2.5, "claims": 3.0},
+    "atlantic_coast": {"fire": 1.5, "flood": 3.0, "windstorm": 3.5, "earthquake": 0.5, "construction": 2.5, "claims": 2.5},
+    "inland": {"fire": 2.0, "flood": 2.0, "windstorm": 2.5, "earthquake": 1.0, "construction": 2.5, "claims": 2.0},
+}
+
+def region_of(lat: Optional[float], lon: Optional[float]) -> str:
+    if lat is not None and lon is not None:
+        for region, (lat_min, lat_max, lon_min, lon_max) in REGIONS.items():
+            if lat_min <= lat <= lat_max and lon_min <= lon <= lon_max:
+                return region
+    return "inland"
+
+def regional_default(peril: str, lat: Optional[float] = None, lon: Optional[float] = None) -> Tuple[float, float]:
+    """(score, confidence) to use for a peril no provider or cache could answer"""
+    return REGIONAL_DEFAULTS[region_of(lat, lon)][peril], REGIONAL_DEFAULT_CONFIDENCE
+
+# ------------------------------
+# Latency budget
+# ------------------------------
+
+class LatencyBudget:
+    """Wall-clock budget of one submission, split across providers by share"""
+
+    def __init__(self, seconds: float, shares: Optional[Dict[str, float]] = None):
+        self.seconds = seconds
+        self.shares = {**DEFAULT_BUDGET_SHARES, **(shares or {})}
+        self.deadline = time.monotonic() + seconds
+
+    def remaining(self) -> float:
+        return max(self.deadline - time.monotonic(), 0.0)
+
+    def for_provider(self, provider: str, cap: Optional[float] = None) -> float:
+        """Timeout for one call to provider: its share of the budget, bounded by what is left and by cap"""
+        allowed = min(self.seconds * self.shares.get(provider, 1.0), self.remaining())
+        return min(allowed, cap) if cap is not None else allowed
+
+_budget: ContextVar[Optional[LatencyBudget]] = ContextVar("insuriq_latency_budget", default=None)
+
+@contextmanager
+def submission_budget(seconds: float, shares: Optional[Dict[str, float]] = None):
+    """Provider calls made inside this block (on any thread or loop the context flows to) share one budget"""
+    token = _budget.set(LatencyBudget(seconds, shares))
+    try:
+        yield _budget.get()
+    finally:
+        _budget.reset(token)
+
+def current_budget() -> Optional[LatencyBudget]:
+    return _budget.get()
+
+# ------------------------------
+# Circuit breaker
+# ------------------------------
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures; after reset_timeout one
+    probe call is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self._opened_at >= self.reset_timeout:
+                self.state = "half_open"
+                self._probing = False
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+    def release(self):
+        """Give up a call without an outcome (e.g. cancelled), so the next call may probe"""
+        with self._lock:
+            self._probing = False
+
+# ------------------------------
+# Hedged requests
+# ------------------------------
+
+class LatencyTracker:
+    """Recent successful call latencies of one provider, for choosing when to hedge"""
+
+    def __init__(self, window: int = 200, min_samples: int = 20, min_delay: float = 0.05):
+        self._samples = deque(maxlen=window)
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+
+    def observe(self, seconds: float):
+        self._samples.append(seconds)
+
+    def hedge_delay(self, quantile: float = 0.95) -> Optional[float]:
+        """Recent p95 latency, or None until enough calls have been seen"""
+        if len(self._samples) < self.min_samples:
+            return None
+        ordered = sorted(self._samples)
+        return max(ordered[min(int(len(ordered) * quantile), len(ordered) - 1)], self.min_delay)
+
+async def hedged(attempt: Callable[[], Awaitable], delay: Optional[float], timeout: float, max_attempts: int = 2):
+    """
+    Run attempt(); if it has not finished after `delay` seconds, or fails, start
+    another, up to max_attempts in total. The first successful result wins and the
+    rest are cancelled. Raises the last error when every attempt fails, or
+    TimeoutError once timeout has passed.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    tasks = {asyncio.ensure_future(attempt())}
+    started = 1
+    error: Optional[BaseException] = None
+    try:
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise asyncio.TimeoutError()
+            can_hedge = delay is not None and started < max_attempts
+            done, _ = await asyncio.wait(tasks, timeout=min(delay, remaining) if can_hedge else remaining,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                tasks.discard(task)
+                if task.exception() is None:
+                    return task.result()
+                error = task.exception()
+            if tasks and done:
+                continue  # an attempt failed but another is still running
+            if done and started >= max_attempts:
+                raise error
+            if done or can_hedge:
+                # Retry after a failure, or hedge an attempt slower than the provider's p95
+                tasks.add(asyncio.ensure_future(attempt()))
+                started += 1
+    finally:
+        for task in tasks:
+            task.cancel()
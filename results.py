@@ -0,0 +1,227 @@
+"""
+Compact peril results.
+
+Providers and workflow nodes pass PerilResult, a slotted object with no
+validation, instead of a pydantic model per peril. ResultBatch holds the results
+of many properties as typed columns (scores, confidences, fallbacks and every
+factor), which is what batch runs buffer. RiskAssessmentResult, the pydantic
+model, is only built at the API boundary with to_model().
+
+Provider payloads (raw_data) are dropped as soon as a result is created when
+INSURIQ_KEEP_RAW_DATA=0, or when KEEP_RAW_DATA is set to False. With a payload
+store (payload_store.py) they are offloaded and only raw_ref is kept.
+"""
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from pydantic import BaseModel
+
+KEEP_RAW_DATA = os.getenv("INSURIQ_KEEP_RAW_DATA", "1") == "1"
+
+FactorValue = Union[float, str, None]
+
+# Codes of ResultBatch's fallback column; 0 is a result straight from the provider
+FALLBACK_KINDS = (None, "stale_cache", "regional_default")
+
+class RiskAssessmentResult(BaseModel):
+    score: float  # Risk score between 0-5
+    confidence: float  # Confidence score between 0-1
+    factors: Dict[str, FactorValue]  # Contributing factors (FEMA zone, condition, ...)
+    raw_data: Optional[Dict] = None  # Raw API response data, unless dropped or offloaded
+    raw_ref: Optional[str] = None  # Payload store reference of the offloaded raw_data
+    fallback: Optional[str] = None  # "stale_cache" or "regional_default" when degraded
+
+class PerilResult:
+    """One peril's assessment; to_model() gives the pydantic form"""
+    __slots__ = ("score", "confidence", "factors", "raw_data", "fallback", "raw_ref")
+
+    def __init__(self, score: float, confidence: float, factors: Optional[Dict[str, FactorValue]] = None,
+                 raw_data: Optional[Dict] = None, fallback: Optional[str] = None, raw_ref: Optional[str] = None):
+        self.score = float(score)
+        self.confidence = float(confidence)
+        self.factors = factors or {}
+        self.raw_data = raw_data if KEEP_RAW_DATA else None
+        self.fallback = fallback
+        self.raw_ref = raw_ref
+
+    def offload(self, store) -> "PerilResult":
+        """Move raw_data into a PayloadStore, keeping only its reference"""
+        if self.raw_data:
+            self.raw_ref = store.put(self.raw_data)
+            self.raw_data = None
+        return self
+
+    def __repr__(self) -> str:
+        return f"PerilResult(score={self.score}, confidence={self.confidence}, fallback={self.fallback!r})"
+
+    def as_dict(self) -> Dict:
+        return {"score": self.score, "confidence": self.confidence, "factors": self.factors,
+                "raw_data": self.raw_data, "fallback": self.fallback, "raw_ref": self.raw_ref}
+
+    def to_model(self) -> RiskAssessmentResult:
+        return RiskAssessmentResult(**self.as_dict())
+
+# ------------------------------
+# Columnar batch
+# ------------------------------
+
+class _FactorColumn:
+    """One factor of one peril: numbers in a float64 array, strings as int32 codes into categories"""
+    __slots__ = ("values", "codes", "categories", "_index")
+
+    def __init__(self, capacity: int):
+        import numpy as np
+        self.values = np.full(capacity, np.nan)
+        self.codes: Optional[np.ndarray] = None  # allocated when the first string arrives
+        self.categories: List[str] = []
+        self._index: Dict[str, int] = {}
+
+    def set(self, row: int, value: FactorValue):
+        import numpy as np
+        if isinstance(value, str):
+            if self.codes is None:
+                self.codes = np.full(len(self.values), -1, dtype=np.int32)
+            code = self._index.get(value)
+            if code is None:
+                code = self._index[value] = len(self.categories)
+                self.categories.append(value)
+            self.codes[row] = code
+        elif value is not None:
+            self.values[row] = float(value)
+
+    def get(self, row: int) -> FactorValue:
+        if self.codes is not None and self.codes[row] >= 0:
+            return self.categories[self.codes[row]]
+        value = self.values[row]
+        return None if value != value else float(value)  # NaN marks a missing factor
+
+    def grow(self, capacity: int):
+        import numpy as np
+        self.values = np.concatenate([self.values, np.full(capacity - len(self.values), np.nan)])
+        if self.codes is not None:
+            self.codes = np.concatenate([self.codes, np.full(capacity - len(self.codes), -1, dtype=np.int32)])
+
+class ResultBatch:
+    """
+    Peril results of many properties as typed columns: an N x perils matrix each
+    for scores (float64), confidences (float32) and fallback codes (uint8), plus
+    one column per (peril, factor). raw_data is kept only with keep_raw_data.
+    """
+
+    def __init__(self, perils: Optional[Sequence[str]] = None, capacity: int = 1024,
+                 keep_raw_data: bool = False):
+        import numpy as np
+        if perils is None:
+            from scoring import PERILS as perils
+        self.perils = tuple(perils)
+        self._column = {peril: i for i, peril in enumerate(self.perils)}
+        self._rows = 0
+        self._scores = np.full((capacity, len(self.perils)), np.nan)
+        self._confidence = np.full((capacity, len(self.perils)), np.nan, dtype=np.float32)
+        self._fallback = np.zeros((capacity, len(self.perils)), dtype=np.uint8)
+        self._factors: Dict[Tuple[str, str], _FactorColumn] = {}
+        self._raw_data: Optional[List[Dict[str, Optional[Dict]]]] = [] if keep_raw_data else None
+        self._raw_refs: Dict[Tuple[int, str], str] = {}  # sparse: only offloaded payloads have one
+
+    def __len__(self) -> int:
+        return self._rows
+
+    @property
+    def scores(self):
+        return self._scores[:self._rows]
+
+    @property
+    def confidence(self):
+        return self._confidence[:self._rows]
+
+    def append(self, results: Dict[str, Optional[PerilResult]]) -> int:
+        """Add one property's results (missing perils stay NaN) and return its row"""
+        if self._rows == len(self._scores):
+            self._grow(2 * len(self._scores))
+        row = self._rows
+        for peril, result in results.items():
+            if result is None:
+                continue
+            col = self._column[peril]
+            self._scores[row, col] = result.score
+            self._confidence[row, col] = result.confidence
+            self._fallback[row, col] = FALLBACK_KINDS.index(result.fallback)
+            if result.raw_ref:
+                self._raw_refs[(row, peril)] = result.raw_ref
+            for name, value in result.factors.items():
+                column = self._factors.get((peril, name))
+                if column is None:
+                    column = self._factors[(peril, name)] = _FactorColumn(len(self._scores))
+                column.set(row, value)
+        if self._raw_data is not None:
+            self._raw_data.append({peril: result.raw_data for peril, result in results.items() if result is not None})
+        self._rows += 1
+        return row
+
+    def extend(self, rows: Iterable[Dict[str, Optional[PerilResult]]]):
+        for results in rows:
+            self.append(results)
+
+    def raw_refs(self, peril: str) -> List[Optional[str]]:
+        return [self._raw_refs.get((row, peril)) for row in range(self._rows)]
+
+    def fallback(self, peril: str) -> List[Optional[str]]:
+        return [FALLBACK_KINDS[code] for code in self._fallback[:self._rows, self._column[peril]]]
+
+    def factor(self, peril: str, name: str):
+        """One factor column: float64 when every value is numeric, else an object array"""
+        import numpy as np
+        column = self._factors.get((peril, name))
+        if column is None:
+            return np.full(self._rows, np.nan)
+        if column.codes is None:
+            return column.values[:self._rows]
+        return np.array([column.get(row) for row in range(self._rows)], dtype=object)
+
+    def result(self, row: int, peril: str) -> Optional[PerilResult]:
+        """Rebuild one result (None when the peril was not assessed for that row)"""
+        col = self._column[peril]
+        score = self._scores[row, col]
+        if score != score:
+            return None
+        factors = {name: column.get(row) for (p, name), column in self._factors.items() if p == peril}
+        raw_data = self._raw_data[row].get(peril) if self._raw_data is not None else None
+        return PerilResult(score, float(self._confidence[row, col]),
+                           {name: value for name, value in factors.items() if value is not None},
+                           raw_data, FALLBACK_KINDS[self._fallback[row, col]], self._raw_refs.get((row, peril)))
+
+    def models(self, row: int) -> Dict[str, RiskAssessmentResult]:
+        """Pydantic results of one row, for the API boundary"""
+        results = {peril: self.result(row, peril) for peril in self.perils}
+        return {peril: result.to_model() for peril, result in results.items() if result is not None}
+
+    def columns(self, factors: bool = True) -> Dict[str, object]:
+        """Flat named columns: {peril}, {peril}_confidence, {peril}_fallback, {peril}_raw_ref and {peril}_{factor}"""
+        columns = {}
+        for peril, col in self._column.items():
+            columns[peril] = self._scores[:self._rows, col]
+            columns[f"{peril}_confidence"] = self._confidence[:self._rows, col]
+            columns[f"{peril}_fallback"] = self.fallback(peril)
+            columns[f"{peril}_raw_ref"] = self.raw_refs(peril)
+        for peril, name in self._factors if factors else ():
+            columns[f"{peril}_{name}"] = self.factor(peril, name)
+        return columns
+
+    def clear(self):
+        """Drop every row but keep the allocated columns"""
+        self._rows = 0
+        self._scores.fill(float("nan"))
+        self._confidence.fill(float("nan"))
+        self._fallback.fill(0)
+        self._factors = {}
+        self._raw_refs = {}
+        if self._raw_data is not None:
+            self._raw_data = []
+
+    def _grow(self, capacity: int):
+        import numpy as np
+        pad = capacity - len(self._scores)
+        self._scores = np.vstack([self._scores, np.full((pad, len(self.perils)), np.nan)])
+        self._confidence = np.vstack([self._confidence, np.full((pad, len(self.perils)), np.nan, dtype=np.float32)])
+        self._fallback = np.vstack([self._fallback, np.zeros((pad, len(self.perils)), dtype=np.uint8)])
+        for column in self._factors.values():
+            column.grow(capacity)
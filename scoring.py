@@ -0,0 +1,67 @@
+"""
+Columnar NATCAT scoring kernel.
+
+Scores whole portfolios in one pass: an N x 6 matrix of 0-5 peril scores times
+the weights vector gives N composite scores, which are thresholded into
+STP/Referred decisions. The single-property workflow nodes call the same
+functions on a 1 x 6 matrix so both paths produce identical results.
+"""
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+
+# Column order of every peril-score matrix
+PERILS = ("fire", "flood", "windstorm", "earthquake", "construction", "claims")
+
+MAX_PERIL_SCORE = 5.0  # Peril scores range 0-5
+SCORE_SCALE = 20.0  # Weighted 0-5 peril scores -> 0-100 NATCAT score
+STP_THRESHOLD = 50.0  # Scores below this go straight through
+
+def weights_vector(weights: Dict[str, float]) -> np.ndarray:
+    """Weights as a vector aligned with PERILS; perils without a weight count 0"""
+    return np.array([weights.get(peril, 0.0) for peril in PERILS], dtype=np.float64)
+
+def peril_matrix(risk_scores: Iterable[Dict[str, float]]) -> np.ndarray:
+    """Stack per-property risk_scores dicts into an N x 6 matrix; missing perils are 0"""
+    return np.array(
+        [[scores.get(peril) or 0.0 for peril in PERILS] for scores in risk_scores],
+        dtype=np.float64
+    ).reshape(-1, len(PERILS))
+
+def natcat_scores(matrix: np.ndarray, weights: Dict[str, float]) -> np.ndarray:
+    """Composite 0-100 NATCAT score for every row of an N x 6 peril-score matrix"""
+    return np.asarray(matrix, dtype=np.float64) @ weights_vector(weights) * SCORE_SCALE
+
+def stp_mask(scores: np.ndarray, threshold: float = STP_THRESHOLD) -> np.ndarray:
+    """True where a property is eligible for straight through processing"""
+    return np.asarray(scores) < threshold
+
+def decisions(scores: np.ndarray, threshold: float = STP_THRESHOLD) -> np.ndarray:
+    """STP/Referred label for every score"""
+    return np.where(stp_mask(scores, threshold), "STP", "Referred")
+
+def score_portfolio(matrix: np.ndarray, weights: Dict[str, float],
+                    threshold: float = STP_THRESHOLD) -> Tuple[np.ndarray, np.ndarray]:
+    """NATCAT scores and decisions for a whole portfolio"""
+    scores = natcat_scores(matrix, weights)
+    return scores, decisions(scores, threshold)
+
+def score_bounds(known: Dict[str, float], weights: Dict[str, float]) -> Tuple[float, float]:
+    """
+    Lowest and highest NATCAT score still possible when only the perils in
+    `known` have been scored and every other peril may land anywhere in 0-5
+    """
+    low = float(natcat_scores(peril_matrix([known]), weights)[0])
+    unknown = np.array([peril not in known for peril in PERILS])
+    return low, low + float(weights_vector(weights)[unknown].sum()) * MAX_PERIL_SCORE * SCORE_SCALE
+
+def format_score(low: float, high: float) -> str:
+    """NATCAT score for display: the score itself, or the range it is bounded to while perils are unassessed"""
+    return f"{low:.1f}" if high - low < 0.05 else f"{low:.1f}-{high:.1f}"
+
+def settled_decision(low: float, high: float, threshold: float = STP_THRESHOLD) -> Optional[str]:
+    """The decision every score in [low, high] gets, or None while the bounds straddle the threshold"""
+    if high < threshold:
+        return "STP"
+    if low >= threshold:
+        return "Referred"
+    return None
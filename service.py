@@ -0,0 +1,142 @@
+"""
+HTTP underwriting service around the compiled workflow.
+
+Requests are handled on one event loop; each distinct submission runs the graph
+on a worker thread, and identical submissions that arrive while one is already
+in flight wait on that execution instead of starting their own.
+
+    uvicorn service:app --host 0.0.0.0 --port 8000
+    curl -XPOST localhost:8000/underwrite -d '{"address": "123 Main St, Los Angeles, CA", ...}'
+"""
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import FileResponse, ORJSONResponse, PlainTextResponse
+from pydantic import BaseModel, Field
+from geocoder import normalize_address
+from main import get_runtime
+from metrics import REGISTRY
+from payload_store import default_store
+
+logger = logging.getLogger(__name__)
+
+# Graph executions running at once; submissions beyond this queue on the executor
+WORKERS = int(os.getenv("INSURIQ_SERVICE_WORKERS", "32"))
+MAX_BATCH = int(os.getenv("INSURIQ_SERVICE_MAX_BATCH", "500"))
+
+class Submission(BaseModel):
+    property_id: str = ""
+    property_type: str = "Residential"
+    address: str
+    construction_type: str = "unknown"
+    year_built: int
+    floors: int = 1
+
+class BatchRequest(BaseModel):
+    submissions: List[Submission] = Field(..., min_length=1)
+
+def submission_key(inputs: Dict) -> Tuple:
+    """Submissions with the same key get the same underwriting result; property_id is only a label"""
+    return (
+        normalize_address(inputs["address"]),
+        inputs["property_type"].strip().lower(),
+        inputs["construction_type"].strip().lower(),
+        inputs["year_built"],
+        inputs["floors"],
+    )
+
+class Coalescer:
+    """Runs each distinct in-flight submission once and shares its result with every identical caller"""
+
+    def __init__(self, executor: ThreadPoolExecutor):
+        self._executor = executor
+        self._in_flight: Dict[Tuple, asyncio.Future] = {}
+        self.stats = {"executed": 0, "coalesced": 0}
+
+    async def underwrite(self, inputs: Dict) -> Dict:
+        key = submission_key(inputs)
+        execution = self._in_flight.get(key)
+        if execution is None:
+            loop = asyncio.get_running_loop()
+            execution = loop.run_in_executor(self._executor, get_runtime().invoke, inputs)
+            self._in_flight[key] = execution
+            execution.add_done_callback(lambda _: self._in_flight.pop(key, None))
+            self.stats["executed"] += 1
+        else:
+            self.stats["coalesced"] += 1
+        # Shield so a disconnected client does not cancel the execution others are waiting on
+        state = await asyncio.shield(execution)
+        # Each caller sees its own inputs (property_id) on the shared result; peril
+        # results become pydantic models only here, at the response boundary
+        risk_results = {peril: result.to_model() for peril, result in state.get("risk_results", {}).items()}
+        return {**state, "inputs": inputs, "risk_results": risk_results}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    executor = ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="underwrite")
+    # Compile the graph and build the clients before taking traffic
+    await asyncio.get_running_loop().run_in_executor(executor, lambda: get_runtime().app)
+    app.state.coalescer = Coalescer(executor)
+    yield
+    executor.shutdown(wait=True)
+
+app = FastAPI(title="InsurIQ", default_response_class=ORJSONResponse, lifespan=lifespan)
+
+@app.get("/healthz")
+async def healthz() -> Dict[str, Any]:
+    return {"status": "ok", **app.state.coalescer.stats}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics() -> PlainTextResponse:
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/payloads/{ref}")
+async def payload(ref: str) -> FileResponse:
+    """Raw provider payload behind a result's raw_ref, sent as stored (zlib, Content-Encoding: deflate)"""
+    store = default_store()
+    try:
+        path = store.path(ref)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if ref not in store:
+        raise HTTPException(status_code=404, detail=f"{ref} is not in the payload store")
+    return FileResponse(path, media_type="application/json", headers={"Content-Encoding": "deflate"})
+
+@app.post("/underwrite")
+async def underwrite(submission: Submission) -> Dict:
+    try:
+        return await app.state.coalescer.underwrite(submission.model_dump())
+    except Exception as e:
+        logger.error(f"Underwriting failed for {submission.address}: {e}")
+        raise HTTPException(status_code=502, detail=str(e))
+
+@app.post("/underwrite/batch")
+async def underwrite_batch(batch: BatchRequest) -> Dict[str, List[Dict]]:
+    """Underwrite every submission concurrently; one failure does not fail the batch"""
+    if len(batch.submissions) > MAX_BATCH:
+        raise HTTPException(status_code=413, detail=f"At most {MAX_BATCH} submissions per batch")
+    coalescer = app.state.coalescer
+    outcomes = await asyncio.gather(
+        *(coalescer.underwrite(s.model_dump()) for s in batch.submissions), return_exceptions=True
+    )
+    results: List[Dict] = []
+    for submission, outcome in zip(batch.submissions, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Underwriting failed for {submission.address}: {outcome}")
+            results.append({"inputs": submission.model_dump(), "error": str(outcome)})
+        else:
+            results.append(outcome)
+    return {"results": results}
+
+def main(host: Optional[str] = None, port: Optional[int] = None):
+    import uvicorn
+    uvicorn.run(app, host=host or os.getenv("INSURIQ_HOST", "127.0.0.1"),
+                port=port or int(os.getenv("INSURIQ_PORT", "8000")))
+
+if __name__ == "__main__":
+    main()
@@ -1,41 +1,188 @@
+import contextlib
+import logging
+import queue
+import threading
+import time
 import snowflake.connector
 from snowflake.connector.pandas_tools import write_pandas
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import pandas as pd
+import pyarrow as pa
+from claims_index import ClaimsIndex
+from decision_sink import DEFAULT_SPOOL_PATH, DecisionSink
 
-class SnowflakeClient:
-    def __init__(self):
-        self.conn = snowflake.connector.connect(
-            user='INSURIQ_USER',
-            password='password',
-            account='your_account',
-            warehouse='UNDERWRITING_WH',
-            database='INSURIQ_DB',
-            schema='UNDERWRITING'
-        )
+logger = logging.getLogger(__name__)
+
+DEFAULT_CONNECTION = {
+    "user": 'INSURIQ_USER',
+    "password": 'password',
+    "account": 'your_account',
+    "warehouse": 'UNDERWRITING_WH',
+    "database": 'INSURIQ_DB',
+    "schema": 'UNDERWRITING'
+}
+
+class SnowflakeConnectionPool:
+    """Bounded pool of Snowflake connections, health-checked when checked out"""
+
+    def __init__(self, connect_kwargs: Dict, size: int = 4, health_check_interval: float = 60.0):
+        self._connect_kwargs = connect_kwargs
+        self._idle = queue.LifoQueue(maxsize=size)  # LIFO keeps the warmest connections busy
+        self._slots = threading.BoundedSemaphore(size)
+        self._health_check_interval = health_check_interval
+        self._last_used: Dict[int, float] = {}
+
+    @contextlib.contextmanager
+    def connection(self, timeout: Optional[float] = None):
+        """Borrow a connection; blocks up to timeout seconds when every connection is in use"""
+        if not self._slots.acquire(timeout=timeout):
+            raise TimeoutError("No Snowflake connection available")
+        conn = None
+        try:
+            conn = self._checkout()
+            yield conn
+        finally:
+            if conn is not None:
+                self._checkin(conn)
+            self._slots.release()
+
+    def close(self):
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+    def _checkout(self):
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            return snowflake.connector.connect(**self._connect_kwargs)
+        if self._healthy(conn):
+            return conn
+        logger.info("Replacing unhealthy Snowflake connection")
+        with contextlib.suppress(Exception):
+            conn.close()
+        self._last_used.pop(id(conn), None)
+        return snowflake.connector.connect(**self._connect_kwargs)
+
+    def _checkin(self, conn):
+        if conn.is_closed():
+            self._last_used.pop(id(conn), None)
+            return
+        self._last_used[id(conn)] = time.monotonic()
+        self._idle.put_nowait(conn)
+
+    def _healthy(self, conn) -> bool:
+        """Cheap check for recently used connections, a round-trip for idle ones"""
+        if conn.is_closed():
+            return False
+        if time.monotonic() - self._last_used.get(id(conn), 0) < self._health_check_interval:
+            return True
+        try:
+            cur = conn.cursor()
+            try:
+                cur.execute("SELECT 1")
+                return True
+            finally:
+                cur.close()
+        except Exception:
+            return False
+
+def stream_query(pool: SnowflakeConnectionPool, query, params=None) -> Iterator[pa.Table]:
+    """Yield query results as Arrow batches; the pooled connection is held until iteration ends"""
+    with pool.connection() as conn:
+        cur = conn.cursor()
+        try:
+            cur.execute(query, params)
+            yield from cur.fetch_arrow_batches()
+        finally:
+            cur.close()
 
-    def get_historical_claims(self, lat: float, lon: float, radius_km: float = 5):
+def count_claims(pool: SnowflakeConnectionPool, points: Sequence[Tuple[float, float]], radius_km: float = 5,
+                 years: int = 5, chunk_size: int = 5000) -> List[int]:
+    """
+    Claims within radius_km over the last `years` years for every (lat, lon) point.
+    Each chunk of points is joined against claims_history as a VALUES list in one round-trip.
+    """
+    counts = [0] * len(points)
+    for start in range(0, len(points), chunk_size):
+        chunk = points[start:start + chunk_size]
+        # Only the placeholder count is formatted into the SQL; every value is bound
+        values = ", ".join(["(%s, %s, %s)"] * len(chunk))
+        params = [v for i, (lat, lon) in enumerate(chunk, start) for v in (i, lat, lon)]
         query = f"""
-        SELECT * 
+        WITH points (idx, lat, lon) AS (
+            SELECT column1, column2, column3 FROM VALUES {values}
+        )
+        SELECT p.idx, COUNT(c.claim_date)
+        FROM points p
+        LEFT JOIN claims_history c
+          ON ST_DWITHIN(ST_MAKEPOINT(p.lon, p.lat), ST_MAKEPOINT(c.longitude, c.latitude), %s)
+         AND c.claim_date > DATEADD(year, %s, CURRENT_DATE())
+        GROUP BY p.idx
+        """
+        for batch in stream_query(pool, query, params + [radius_km * 1000, -years]):
+            for idx, count in zip(batch.column(0).to_pylist(), batch.column(1).to_pylist()):
+                counts[idx] = count
+    return counts
+
+class SnowflakeClient:
+    def __init__(self, connect_kwargs: Optional[Dict] = None, pool_size: int = 4,
+                 claims_index: Optional[ClaimsIndex] = None,
+                 decision_spool: str = DEFAULT_SPOOL_PATH):
+        # Local claims snapshot; when present, radius lookups never reach the warehouse
+        self.claims_index = claims_index
+        self.pool = SnowflakeConnectionPool(connect_kwargs or DEFAULT_CONNECTION, size=pool_size)
+        # Decisions are loaded in bulk off the request path
+        self.decision_sink = DecisionSink(self._write_decisions, spool_path=decision_spool)
+
+    def get_historical_claims(self, lat: float, lon: float, radius_km: float = 5) -> pa.Table:
+        if self.claims_index is not None:
+            rows = self.claims_index.claims_within(lat, lon, radius_km, limit=100)
+            return pa.Table.from_pandas(rows, preserve_index=False)
+
+        query = """
+        SELECT *
         FROM claims_history
         WHERE ST_DISTANCE(
-            ST_MAKEPOINT({lon}, {lat}),
+            ST_MAKEPOINT(%(lon)s, %(lat)s),
             ST_MAKEPOINT(longitude, latitude)
-        ) <= {radius_km * 1000}
+        ) <= %(radius_m)s
         ORDER BY claim_date DESC
         LIMIT 100
         """
-        return self._execute_query(query)
+        return self._execute_query(query, {"lat": lat, "lon": lon, "radius_m": radius_km * 1000})
 
-    def _execute_query(self, query):
-        cur = self.conn.cursor()
-        try:
-            cur.execute(query)
-            return cur.fetchall()
-        finally:
-            cur.close()
+    def count_claims_bulk(self, points: Sequence[Tuple[float, float]], radius_km: float = 5,
+                          years: int = 5, chunk_size: int = 5000) -> List[int]:
+        """Claims within radius_km over the last `years` years for every (lat, lon) point; see count_claims"""
+        return count_claims(self.pool, points, radius_km, years, chunk_size)
+
+    def refresh_claims_index(self) -> int:
+        """Pull new claims into the local snapshot by claim_date watermark"""
+        with self.pool.connection() as conn:
+            return self.claims_index.refresh(conn)
+
+    def _stream_query(self, query, params=None) -> Iterator[pa.Table]:
+        return stream_query(self.pool, query, params)
+
+    def _execute_query(self, query, params=None) -> pa.Table:
+        batches = list(self._stream_query(query, params))
+        return pa.concat_tables(batches) if batches else pa.table({})
 
     def log_underwriting_decision(self, decision_data):
-        df = pd.DataFrame([decision_data])
-        write_pandas(self.conn, df, "UNDERWRITING_DECISIONS")
+        """Queue a decision for the next bulk load; returns without waiting on the warehouse"""
+        self.decision_sink.submit(decision_data)
+
+    def _write_decisions(self, df: pd.DataFrame):
+        with self.pool.connection() as conn:
+            write_pandas(conn, df, "UNDERWRITING_DECISIONS")
+
+    def close(self):
+        """Flush pending decisions and close pooled connections"""
+        self.decision_sink.close()
+        self.pool.close()
 
     def __del__(self):
-        self.conn.close()
\ No newline at end of file
+        self.pool.close()